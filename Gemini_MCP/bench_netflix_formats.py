@@ -0,0 +1,70 @@
+"""Compare payload size and serialization time of the netflix result formats.
+
+Usage: python bench_netflix_formats.py [rows] [path_to_sqlite_db] [table]
+
+Without a database path a synthetic titles table is generated in memory.
+"""
+import json
+import random
+import sqlite3
+import sys
+import time
+
+from netflix_results import encode_rows, serialize_summary, summarize_query
+
+
+def synthetic_db(rows: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE titles (show_id TEXT, type TEXT, title TEXT, director TEXT, country TEXT,"
+        " release_year INTEGER, rating TEXT, duration TEXT, listed_in TEXT)"
+    )
+    rng = random.Random(42)
+    genres = ["Dramas", "Comedies", "Documentaries", "Action & Adventure", "International TV Shows"]
+    conn.executemany(
+        "INSERT INTO titles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(f"s{i}", rng.choice(["Movie", "TV Show"]), f"Title number {i}", f"Director {i % 97}",
+          rng.choice(["United States", "India", "United Kingdom", "Japan"]), rng.randint(1960, 2024),
+          rng.choice(["TV-MA", "PG-13", "R", "TV-14"]), f"{rng.randint(60, 180)} min",
+          ", ".join(rng.sample(genres, 2))) for i in range(rows)],
+    )
+    return conn
+
+
+def legacy(columns, rows) -> str:
+    # The original execute_sql output: one object per row, pretty-printed
+    return json.dumps([dict(zip(columns, row)) for row in rows], indent=2)
+
+
+def bench(label: str, fn, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<10} {len(payload.encode('utf-8')):>12,} bytes {best * 1000:>10.2f} ms")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    if len(sys.argv) > 2:
+        conn = sqlite3.connect(sys.argv[2])
+        table = sys.argv[3] if len(sys.argv) > 3 else "titles"
+    else:
+        conn, table = synthetic_db(rows), "titles"
+
+    query = f'SELECT * FROM "{table}" LIMIT {rows}'
+    cursor = conn.execute(query)
+    columns = [d[0] for d in cursor.description]
+    data = cursor.fetchall()
+    print(f"{len(data)} rows x {len(columns)} columns\n")
+    print(f"{'format':<10} {'payload':>18} {'time':>13}")
+
+    bench("legacy", lambda: legacy(columns, data))
+    for fmt in ("json", "columnar", "csv", "tsv"):
+        bench(fmt, lambda fmt=fmt: encode_rows(columns, data, fmt))
+    bench("summary", lambda: serialize_summary(*summarize_query(conn, query)))
+
+
+if __name__ == "__main__":
+    main()
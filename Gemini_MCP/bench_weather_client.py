@@ -0,0 +1,142 @@
+"""Compare a fresh httpx client per request with the shared pooled client in weather.py.
+
+Usage: python bench_weather_client.py [forecasts] [concurrency] [--tls] [--handshake-ms N]
+
+Starts a local stand-in for the NWS API and runs `forecasts` get_forecast-style
+request pairs (/points, then the forecast URL it returns) through both clients.
+`--tls` serves HTTPS with a throwaway self-signed certificate (needs openssl on
+PATH); `--handshake-ms` adds a delay to every new connection to stand in for
+the network round trips of a real TCP+TLS handshake.
+"""
+import asyncio
+import json
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+import weather
+
+
+class StandInNWS(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, delayed ACKs stall keep-alive requests
+    disable_nagle_algorithm = True
+    handshake_delay = 0.0
+    base = ""
+
+    def setup(self):
+        super().setup()
+        # One call per accepted connection
+        self.server.connections += 1
+        time.sleep(self.handshake_delay)
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.path.startswith("/points/"):
+            lat, lon = self.path.rsplit("/", 1)[1].split(",")
+            body = {"properties": {"forecast": f"{self.base}/gridpoints/TST/{lat},{lon}/forecast"}}
+        elif self.path.endswith("/forecast"):
+            body = {"properties": {"periods": [
+                {"name": f"Period {i}", "temperature": 60 + i, "temperatureUnit": "F", "windSpeed": "5 mph",
+                 "windDirection": "N", "detailedForecast": "Sunny."} for i in range(14)
+            ]}}
+        elif self.path.startswith("/alerts/"):
+            body = {"features": []}
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/geo+json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(tls: bool, handshake_ms: float):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInNWS)
+    server.daemon_threads = True
+    server.connections = 0
+    server.requests = 0
+    scheme = "http"
+    if tls:
+        tmp = Path(tempfile.mkdtemp())
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+             "-keyout", str(tmp / "key.pem"), "-out", str(tmp / "cert.pem")],
+            check=True, capture_output=True,
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(tmp / "cert.pem", tmp / "key.pem")
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    StandInNWS.handshake_delay = handshake_ms / 1000
+    StandInNWS.base = f"{scheme}://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, StandInNWS.base
+
+
+async def per_call_request(url: str):
+    # What make_nws_request used to do: a new client, and so a new connection, per call
+    async with httpx.AsyncClient(verify=False) as client:
+        response = await client.get(url, headers={"User-Agent": weather.USER_AGENT}, timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+
+async def forecast(request, base: str, i: int):
+    points = await request(f"{base}/points/{40 + i % 50 / 100:.2f},-{75 + i % 30 / 100:.2f}")
+    return await request(points["properties"]["forecast"])
+
+
+async def run(label: str, request, base: str, server, forecasts: int, concurrency: int):
+    server.connections = server.requests = 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with limit:
+            await forecast(request, base, i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(forecasts)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed * 1000:>10.1f} ms {server.requests:>9} {server.connections:>12}")
+
+
+async def main():
+    positional, tls, handshake_ms = [], False, 0.0
+    argv = iter(sys.argv[1:])
+    for arg in argv:
+        if arg == "--tls":
+            tls = True
+        elif arg == "--handshake-ms":
+            handshake_ms = float(next(argv))
+        else:
+            positional.append(arg)
+    forecasts = int(positional[0]) if positional else 100
+    concurrency = int(positional[1]) if len(positional) > 1 else 4
+
+    server, base = start_server(tls, handshake_ms)
+    # The stand-in server speaks HTTP/1.1 only
+    weather._client = weather.new_client(verify=False, http2=False)
+    print(f"{forecasts} forecasts, concurrency {concurrency}, {'https' if tls else 'http'}, "
+          f"{handshake_ms:g} ms per new connection\n")
+    print(f"{'client':<12} {'time':>13} {'requests':>9} {'connections':>12}")
+    await run("per-call", per_call_request, base, server, forecasts, concurrency)
+    await run("shared", weather.make_nws_request, base, server, forecasts, concurrency)
+    await weather.close_client()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
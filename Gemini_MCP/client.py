@@ -130,7 +130,9 @@
 
 import asyncio
 import json
+import os
 import sys
+import weakref
 from typing import Dict, List, Optional
 from pathlib import Path
 from contextlib import AsyncExitStack
@@ -140,9 +142,25 @@ from datetime import datetime
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from gemini_pool import CancelToken, GeminiPoolUnavailable, GeminiWorkerError, GeminiWorkerPool, gemini_executable
+
+# The shared response cache lives at the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from gemini_cache import get_cache, is_cacheable, tool_max_age
+
 # Path to Gemini CLI settings
 SETTINGS_FILE = r"C:\Users\Anish\.gemini\settings.json"
 
+# Warm Gemini CLI workers (0 disables the pool and uses one-shot `gemini -p`)
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "2"))
+GEMINI_POOL_MAX_REQUESTS = int(os.getenv("GEMINI_POOL_MAX_REQUESTS", "50"))
+# Let pooled workers run tools that ask for confirmation (shell, file edits, untrusted MCP
+# tools) without one; off by default, since nobody sees or confirms the request
+GEMINI_AUTO_APPROVE = os.getenv("GEMINI_AUTO_APPROVE", "0") == "1"
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "300"))
+# Upper bound on Gemini calls in flight per client
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
 
 def log(message: str, level: str = "INFO"):
     """Prints a log message with timestamp and level inline in chat."""
@@ -159,6 +177,10 @@ class MCPClient:
         self.sessions: Dict[str, ClientSession] = {}
         self.exit_stack = AsyncExitStack()
         self.settings_file = SETTINGS_FILE
+        self.gemini_pool: Optional[GeminiWorkerPool] = None
+        # server name -> tool names, part of the response cache key
+        self.tool_config: Dict[str, List[str]] = {}
+        self._gemini_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
 
     async def connect_to_servers(self, server_script_paths: List[str]):
         log("Starting connection to MCP servers...")
@@ -190,6 +212,7 @@ class MCPClient:
             log(f"Available tools for {server_name}: {tool_names or '[none]'}")
 
             self.sessions[server_name] = session
+            self.tool_config[server_name] = tool_names
 
             servers_info.append({
                 "name": server_name,
@@ -199,6 +222,26 @@ class MCPClient:
             })
 
         self._register_mcp_servers(servers_info)
+        # Workers read settings.json at startup, so warm them only after registration.
+        self.start_gemini_pool()
+
+    def start_gemini_pool(self):
+        if GEMINI_POOL_SIZE <= 0:
+            return
+        log(f"Warming up {GEMINI_POOL_SIZE} Gemini CLI worker(s)...")
+        pool = GeminiWorkerPool(
+            size=GEMINI_POOL_SIZE,
+            max_requests=GEMINI_POOL_MAX_REQUESTS,
+            auto_approve=GEMINI_AUTO_APPROVE,
+            request_timeout=GEMINI_REQUEST_TIMEOUT,
+        )
+        try:
+            pool.start()
+        except GeminiWorkerError as e:
+            log(f"Gemini worker pool unavailable, using one-shot CLI calls: {e}", "WARNING")
+            return
+        self.gemini_pool = pool
+        log(f"Gemini worker pool ready ({pool.stats['spawned']} worker(s))")
 
     def _register_mcp_servers(self, servers_info: List[dict]):
         log("Registering MCP servers in settings.json...")
@@ -229,8 +272,31 @@ class MCPClient:
 
         log(f"Updated settings.json with servers: {list(mcp_servers.keys())}")
 
-    def call_gemini(self, prompt: str) -> str:
+    def _cache_key(self, prompt: str) -> str:
+        # Responses depend on the prompt and on which MCP tools Gemini can call;
+        # tool-backed answers are only reused for GEMINI_CACHE_TOOL_TTL seconds
+        return get_cache().make_key(prompt, model="gemini-cli", tools=self.tool_config)
+
+    def call_gemini(self, prompt: str, bypass_cache: bool = False) -> str:
         log(f"Calling Gemini CLI with prompt: {prompt}")
+        # Errors and empty answers are returned but never cached
+        return get_cache().get_or_call(
+            self._cache_key(prompt), lambda: self._run_gemini(prompt), bypass=bypass_cache,
+            should_cache=is_cacheable, max_age=tool_max_age(self.tool_config),
+        )
+
+    def _run_gemini(self, prompt: str) -> str:
+        if self.gemini_pool is not None:
+            try:
+                response = self.gemini_pool.call(prompt)
+            except GeminiPoolUnavailable as e:
+                log(f"{e}; falling back to a one-shot CLI call", "WARNING")
+            except GeminiWorkerError as e:
+                log(f"Gemini Error: {e}", "ERROR")
+                return f"[Gemini Error] {e}"
+            else:
+                log("Gemini response received successfully")
+                return response
         result = run(["gemini", "-p", prompt], stdout=PIPE, stderr=PIPE, text=True, shell=True)
         if result.returncode != 0:
             log(f"Gemini Error: {result.stderr.strip()}", "ERROR")
@@ -238,10 +304,71 @@ class MCPClient:
         log("Gemini response received successfully")
         return result.stdout.strip()
 
+    def _gemini_limit(self) -> asyncio.Semaphore:
+        # One semaphore per event loop: Streamlit reruns each get a fresh loop from asyncio.run().
+        loop = asyncio.get_running_loop()
+        if loop not in self._gemini_limits:
+            self._gemini_limits[loop] = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        return self._gemini_limits[loop]
+
+    async def call_gemini_async(self, prompt: str, timeout: Optional[float] = None,
+                                bypass_cache: bool = False) -> str:
+        log(f"Calling Gemini CLI (async) with prompt: {prompt}")
+        cache = get_cache()
+        key = self._cache_key(prompt)
+        cached = cache.get(key, bypass=bypass_cache, max_age=tool_max_age(self.tool_config))
+        if cached is not None:
+            log("Gemini response served from cache")
+            return cached
+
+        timeout = timeout or GEMINI_REQUEST_TIMEOUT
+        try:
+            async with self._gemini_limit():
+                response = await self._run_gemini_async(prompt, timeout)
+        except GeminiWorkerError as e:
+            log(f"Gemini Error: {e}", "ERROR")
+            return f"[Gemini Error] {e}"
+        if is_cacheable(response):
+            cache.set(key, response)
+        return response
+
+    async def _run_gemini_async(self, prompt: str, timeout: float) -> str:
+        if self.gemini_pool is not None:
+            # The pool enforces the timeout itself and recycles a worker that overruns it.
+            token = CancelToken()
+            try:
+                return await asyncio.to_thread(self.gemini_pool.call, prompt, timeout, None, token)
+            except asyncio.CancelledError:
+                # Cancelling the await leaves the worker thread running; stop the prompt and recycle the worker
+                token.cancel()
+                raise
+            except GeminiPoolUnavailable as e:
+                log(f"{e}; falling back to a one-shot CLI call", "WARNING")
+
+        proc = await asyncio.create_subprocess_exec(
+            gemini_executable(), "-p", prompt,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise GeminiWorkerError(f"Gemini CLI timed out after {timeout:g}s")
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            raise
+
+        if proc.returncode != 0:
+            raise GeminiWorkerError(stderr.decode(errors="replace").strip())
+        return stdout.decode(errors="replace").strip()
+
     async def process_query(self, query: str) -> str:
         log(f"Processing user query: {query}")
         try:
-            response = self.call_gemini(query)
+            response = await self.call_gemini_async(query)
             log(f"Final response: {response}")
             print(f"\n[Assistant] {response}")
             return response
@@ -251,6 +378,9 @@ class MCPClient:
 
     async def cleanup(self):
         log("Cleaning up MCP client sessions...")
+        if self.gemini_pool is not None:
+            self.gemini_pool.close()
+            self.gemini_pool = None
         await self.exit_stack.aclose()
 
 
@@ -268,7 +398,8 @@ async def main():
 
     try:
         while True:
-            query = input("\n> ")
+            # Read input off the event loop so MCP sessions stay serviced while idle
+            query = await asyncio.to_thread(input, "\n> ")
             if query.strip().lower() in {"exit", "quit"}:
                 break
             await client.process_query(query)
@@ -156,9 +156,12 @@
 #     st.rerun()
 
 import asyncio
+import codecs
 import json
+import os
 import sys
-from typing import Dict, List, Optional
+import weakref
+from typing import AsyncIterator, Dict, List, Optional
 from pathlib import Path
 from contextlib import AsyncExitStack
 from subprocess import run, PIPE
@@ -167,9 +170,25 @@ import streamlit as st
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+from gemini_pool import CancelToken, GeminiPoolUnavailable, GeminiWorkerError, GeminiWorkerPool, gemini_executable
+
+# The shared response cache lives at the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from gemini_cache import get_cache, is_cacheable, tool_max_age
+
 # Path to Gemini CLI settings
 SETTINGS_FILE = r"C:\Users\Anish\.gemini\settings.json"
 
+# Warm Gemini CLI workers (0 disables the pool and uses one-shot `gemini -p`)
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "2"))
+GEMINI_POOL_MAX_REQUESTS = int(os.getenv("GEMINI_POOL_MAX_REQUESTS", "50"))
+# Let pooled workers run tools that ask for confirmation (shell, file edits, untrusted MCP
+# tools) without one; off by default, since nobody sees or confirms the request
+GEMINI_AUTO_APPROVE = os.getenv("GEMINI_AUTO_APPROVE", "0") == "1"
+GEMINI_REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "300"))
+# Upper bound on Gemini calls in flight per client
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
 
 def server_name_from_path(p: str) -> str:
     """Use the script filename (without extension) as the server name."""
@@ -182,6 +201,10 @@ class MCPClient:
         self.sessions: Dict[str, ClientSession] = {}
         self.exit_stack = AsyncExitStack()
         self.settings_file = SETTINGS_FILE
+        self.gemini_pool: Optional[GeminiWorkerPool] = None
+        # server name -> tool names, part of the response cache key
+        self.tool_config: Dict[str, List[str]] = {}
+        self._gemini_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
 
     async def connect_to_servers(self, server_script_paths: List[str]):
         """Connect to all MCP servers and register them in Gemini MCP settings."""
@@ -215,6 +238,7 @@ class MCPClient:
 
             # Store the session by server name
             self.sessions[server_name] = session
+            self.tool_config[server_name] = tool_names
 
             st.write(f"✅ Connected to **{server_name}** with tools: {tool_names or '[none]'}")
 
@@ -228,6 +252,27 @@ class MCPClient:
         # Register/update all servers in settings.json
         self._register_mcp_servers(servers_info)
 
+        # Workers read settings.json at startup, so warm them only after registration
+        self.start_gemini_pool()
+
+    def start_gemini_pool(self):
+        """Start pre-warmed Gemini CLI workers; fall back to one-shot calls if they cannot start."""
+        if GEMINI_POOL_SIZE <= 0:
+            return
+        pool = GeminiWorkerPool(
+            size=GEMINI_POOL_SIZE,
+            max_requests=GEMINI_POOL_MAX_REQUESTS,
+            auto_approve=GEMINI_AUTO_APPROVE,
+            request_timeout=GEMINI_REQUEST_TIMEOUT,
+        )
+        try:
+            pool.start()
+        except GeminiWorkerError as e:
+            st.write(f"⚠️ Gemini worker pool unavailable, using one-shot CLI calls: {e}")
+            return
+        self.gemini_pool = pool
+        st.write(f"🔥 Warmed up **{pool.stats['spawned']}** Gemini CLI worker(s)")
+
     def _register_mcp_servers(self, servers_info: List[dict]):
         """Merge multiple server entries into settings.json -> mcpServers."""
         try:
@@ -262,14 +307,157 @@ class MCPClient:
 
         st.write(f"📝 Registered/updated MCP servers in {self.settings_file}: **{list(mcp_servers.keys())}**")
 
-    def call_gemini(self, prompt: str) -> str:
-        """Call Gemini CLI with a given prompt (kept intact from your original)."""
+    def _cache_key(self, prompt: str) -> str:
+        """Responses depend on the prompt and on which MCP tools Gemini can call.
+
+        Tool-backed answers are only reused for GEMINI_CACHE_TOOL_TTL seconds.
+        """
+        return get_cache().make_key(prompt, model="gemini-cli", tools=self.tool_config)
+
+    def call_gemini(self, prompt: str, bypass_cache: bool = False) -> str:
+        """Call Gemini CLI with a given prompt, on a warm worker when the pool is running.
+
+        Errors and empty answers are returned but never cached.
+        """
+        return get_cache().get_or_call(
+            self._cache_key(prompt), lambda: self._run_gemini(prompt), bypass=bypass_cache,
+            should_cache=is_cacheable, max_age=tool_max_age(self.tool_config),
+        )
+
+    def _run_gemini(self, prompt: str) -> str:
+        if self.gemini_pool is not None:
+            try:
+                response = self.gemini_pool.call(prompt)
+            except GeminiPoolUnavailable:
+                # No live worker: fall back to a one-shot CLI call
+                pass
+            except GeminiWorkerError as e:
+                return f"[Gemini Error] {e}"
+            else:
+                return response
         result = run(["gemini", "-p", prompt], stdout=PIPE, stderr=PIPE, text=True, shell=True)
         if result.returncode != 0:
             return f"[Gemini Error] {result.stderr.strip()}"
         return result.stdout.strip()
 
-    async def process_query(self, query: str) -> str:
+    def _gemini_limit(self) -> asyncio.Semaphore:
+        # One semaphore per event loop: Streamlit reruns each get a fresh loop from asyncio.run().
+        loop = asyncio.get_running_loop()
+        if loop not in self._gemini_limits:
+            self._gemini_limits[loop] = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        return self._gemini_limits[loop]
+
+    async def stream_gemini_async(self, prompt: str, timeout: Optional[float] = None,
+                                  bypass_cache: bool = False) -> AsyncIterator[str]:
+        """Yield Gemini output chunks as they arrive, with the same limits as call_gemini_async.
+
+        A cached response is yielded as a single chunk; a fresh one is cached once it completes.
+        """
+        cache = get_cache()
+        key = self._cache_key(prompt)
+        cached = cache.get(key, bypass=bypass_cache, max_age=tool_max_age(self.tool_config))
+        if cached is not None:
+            yield cached
+            return
+
+        timeout = timeout or GEMINI_REQUEST_TIMEOUT
+        chunks = []
+        try:
+            async with self._gemini_limit():
+                async for chunk in self._stream(prompt, timeout):
+                    chunks.append(chunk)
+                    yield chunk
+        except GeminiWorkerError as e:
+            yield f"{chr(10) if chunks else ''}[Gemini Error] {e}"
+            return
+
+        response = "".join(chunks).strip()
+        if is_cacheable(response):
+            cache.set(key, response)
+
+    async def _stream(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        """Stream from a warm worker, or from a one-shot CLI run when the pool has no live worker."""
+        if self.gemini_pool is not None:
+            try:
+                async for chunk in self._stream_from_pool(prompt, timeout):
+                    yield chunk
+                return
+            except GeminiPoolUnavailable:
+                # Raised before any chunk arrives, so nothing has been yielded yet
+                pass
+        async for chunk in self._stream_from_cli(prompt, timeout):
+            yield chunk
+
+    async def _stream_from_cli(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        """Stream a one-shot `gemini -p` run; raises GeminiWorkerError on failure or timeout."""
+        proc = await asyncio.create_subprocess_exec(
+            gemini_executable(), "-p", prompt,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stderr_task = asyncio.ensure_future(proc.stderr.read())
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                data = await asyncio.wait_for(proc.stdout.read(4096), max(deadline - loop.time(), 0))
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            await proc.wait()
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            stderr_task.cancel()
+            raise GeminiWorkerError(f"Gemini CLI timed out after {timeout:g}s")
+        except (asyncio.CancelledError, GeneratorExit):
+            proc.kill()
+            await proc.wait()
+            stderr_task.cancel()
+            raise
+
+        stderr = await stderr_task
+        if proc.returncode != 0:
+            raise GeminiWorkerError(stderr.decode(errors="replace").strip())
+
+    async def _stream_from_pool(self, prompt: str, timeout: float) -> AsyncIterator[str]:
+        """Bridge chunks from the pool's reader thread onto this event loop."""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        def on_chunk(text: str):
+            loop.call_soon_threadsafe(chunks.put_nowait, text)
+
+        token = CancelToken()
+        call = asyncio.ensure_future(asyncio.to_thread(self.gemini_pool.call, prompt, timeout, on_chunk, token))
+        try:
+            while not call.done() or not chunks.empty():
+                getter = asyncio.ensure_future(chunks.get())
+                try:
+                    await asyncio.wait({getter, call}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if not getter.done():
+                        getter.cancel()
+                if getter.done() and not getter.cancelled():
+                    yield getter.result()
+        except (asyncio.CancelledError, GeneratorExit):
+            # The worker thread would otherwise run the prompt to completion; stop it and recycle the worker
+            token.cancel()
+            call.cancel()
+            raise
+        # Re-raises GeminiWorkerError from the worker
+        call.result()
+
+    async def call_gemini_async(self, prompt: str, timeout: Optional[float] = None,
+                                bypass_cache: bool = False) -> str:
+        """Awaitable Gemini call: bounded concurrency, timeout, and the subprocess is killed on cancel."""
+        chunks = [chunk async for chunk in self.stream_gemini_async(prompt, timeout, bypass_cache)]
+        return "".join(chunks).strip()
+
+    async def process_query(self, query: str, bypass_cache: bool = False) -> str:
         """Process a user query using Gemini CLI (chat UI behavior unchanged)."""
         st.session_state.messages.append({"role": "user", "content": query})
 
@@ -277,20 +465,28 @@ class MCPClient:
             st.write(query)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    gemini_response = self.call_gemini(query)
-                    st.write(gemini_response)
-                    st.session_state.messages.append({"role": "assistant", "content": gemini_response})
-                    return gemini_response
-                except Exception as e:
-                    error_message = f"An error occurred: {e}"
-                    st.error(error_message)
-                    st.session_state.messages.append({"role": "assistant", "content": error_message})
-                    return error_message
+            placeholder = st.empty()
+            try:
+                # Render chunks as they arrive instead of waiting for the CLI to exit
+                gemini_response = ""
+                async for chunk in self.stream_gemini_async(query, bypass_cache=bypass_cache):
+                    gemini_response += chunk
+                    placeholder.write(gemini_response + "▌")
+                gemini_response = gemini_response.strip()
+                placeholder.write(gemini_response)
+                st.session_state.messages.append({"role": "assistant", "content": gemini_response})
+                return gemini_response
+            except Exception as e:
+                error_message = f"An error occurred: {e}"
+                placeholder.error(error_message)
+                st.session_state.messages.append({"role": "assistant", "content": error_message})
+                return error_message
 
     async def cleanup(self):
-        """Clean up resources (close all sessions)."""
+        """Clean up resources (close all sessions and Gemini workers)."""
+        if self.gemini_pool is not None:
+            self.gemini_pool.close()
+            self.gemini_pool = None
         await self.exit_stack.aclose()
 
 
@@ -335,13 +531,17 @@ except Exception as e:
 if st.session_state.client_state:
     st.success("Connected. Start chatting below!")
 
+    # Identical prompts are answered from the shared response cache unless bypassed
+    bypass_cache = st.sidebar.checkbox("Bypass response cache")
+    st.sidebar.caption("Cache: {hits} hits / {misses} misses".format(**get_cache().stats))
+
     for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
             st.write(msg["content"])
 
     if prompt := st.chat_input("Enter your query..."):
         async def run_query():
-            await st.session_state.client_state.process_query(prompt)
+            await st.session_state.client_state.process_query(prompt, bypass_cache)
 
         asyncio.run(run_query())
 
@@ -0,0 +1,497 @@
+import itertools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional
+
+# Gemini CLI speaks the Agent Client Protocol (JSON-RPC over stdio) in this mode,
+# which lets one process answer many prompts without cold-starting Node and the
+# MCP servers from settings.json every time.
+ACP_FLAG = "--experimental-acp"
+ACP_PROTOCOL_VERSION = 1
+# Seconds between checks for a dead pool while waiting on a worker
+CHECKOUT_POLL = 0.5
+
+
+class GeminiWorkerError(RuntimeError):
+    """Raised when a worker fails to start, dies, or does not answer in time."""
+
+
+class GeminiPoolUnavailable(GeminiWorkerError):
+    """Raised by the pool when it has no live worker and none is starting.
+
+    Callers can fall back to a one-shot `gemini -p` run.
+    """
+
+
+def gemini_executable() -> str:
+    """Resolve the Gemini CLI executable (gemini.cmd on Windows) so it can run without a shell."""
+    return os.getenv("GEMINI_COMMAND") or shutil.which("gemini") or "gemini"
+
+
+def gemini_command() -> List[str]:
+    return [gemini_executable(), ACP_FLAG]
+
+
+class GeminiWorker:
+    """A single long-lived Gemini CLI process speaking ACP.
+
+    It opens a session on start; with `fresh_session`, each later prompt gets a
+    new session so no conversation history carries over between prompts.
+    """
+
+    def __init__(self, cwd: Optional[str] = None, auto_approve: bool = False,
+                 startup_timeout: float = 60.0, command: Optional[List[str]] = None):
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.auto_approve = auto_approve
+        self.startup_timeout = startup_timeout
+        self.command = command or gemini_command()
+        self.proc: Optional[subprocess.Popen] = None
+        self.session_id: Optional[str] = None
+        self.requests = 0
+        self.started_at = 0.0
+        self.broken = False
+
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._chunks: Dict[str, List[str]] = {}
+        self._listeners: Dict[str, Callable[[str], None]] = {}
+        self._write_lock = threading.Lock()
+        self._stderr_tail: deque = deque(maxlen=20)
+
+    # --- lifecycle ---
+
+    def start(self):
+        """Spawn the process, run the ACP handshake and open a session."""
+        try:
+            self.proc = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.cwd,
+                text=True,
+                encoding="utf-8",
+                bufsize=1,
+            )
+        except OSError as e:
+            raise GeminiWorkerError(f"Could not start Gemini CLI: {e}") from e
+
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        threading.Thread(target=self._read_stderr, daemon=True).start()
+
+        try:
+            self._request("initialize", {
+                "protocolVersion": ACP_PROTOCOL_VERSION,
+                "clientCapabilities": {"fs": {"readTextFile": False, "writeTextFile": False}},
+            }, self.startup_timeout)
+            self.session_id = self.new_session()
+        except GeminiWorkerError:
+            self.close()
+            raise
+
+    def new_session(self) -> str:
+        result = self._request("session/new", {"cwd": self.cwd, "mcpServers": []}, self.startup_timeout)
+        return result["sessionId"]
+
+    def close(self):
+        self.broken = True
+        if self.proc is None:
+            return
+        try:
+            if self.proc.stdin:
+                self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self._fail_pending("worker closed")
+
+    def cancel(self):
+        """Abandon the prompt in flight: ask the CLI to stop it and fail the waiting call.
+
+        The worker is marked broken, so the pool recycles it instead of reusing a
+        session that may still be busy.
+        """
+        self.broken = True
+        if self.session_id is not None:
+            self._notify("session/cancel", {"sessionId": self.session_id})
+        self._fail_pending("prompt cancelled")
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None and not self.broken
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def stderr_tail(self) -> str:
+        return "\n".join(self._stderr_tail)
+
+    # --- prompting ---
+
+    def prompt(self, text: str, timeout: Optional[float] = None, fresh_session: bool = False,
+               on_chunk: Optional[Callable[[str], None]] = None) -> str:
+        """Send one prompt and return the concatenated agent message, like `gemini -p`.
+
+        `on_chunk` is called from the reader thread with each text chunk as it arrives.
+        """
+        if fresh_session and self.requests:
+            # The session opened by start() is still unused for the first prompt
+            self.session_id = self.new_session()
+        session_id = self.session_id
+        self._chunks[session_id] = []
+        if on_chunk is not None:
+            self._listeners[session_id] = on_chunk
+        self.requests += 1
+        try:
+            self._request("session/prompt", {
+                "sessionId": session_id,
+                "prompt": [{"type": "text", "text": text}],
+            }, timeout)
+        except GeminiWorkerError:
+            # A half-finished turn leaves the session in an unknown state; let the pool recycle us.
+            self._notify("session/cancel", {"sessionId": session_id})
+            self.broken = True
+            raise
+        finally:
+            chunks = self._chunks.pop(session_id, [])
+            self._listeners.pop(session_id, None)
+        return "".join(chunks).strip()
+
+    # --- JSON-RPC plumbing ---
+
+    def _send(self, message: dict):
+        if not self.proc or self.proc.poll() is not None:
+            raise GeminiWorkerError(f"Gemini CLI worker exited. {self.stderr_tail}".strip())
+        line = json.dumps(message) + "\n"
+        with self._write_lock:
+            try:
+                self.proc.stdin.write(line)
+                self.proc.stdin.flush()
+            except (OSError, ValueError) as e:
+                raise GeminiWorkerError(f"Gemini CLI worker pipe closed: {e}") from e
+
+    def _notify(self, method: str, params: dict):
+        try:
+            self._send({"jsonrpc": "2.0", "method": method, "params": params})
+        except GeminiWorkerError:
+            pass
+
+    def _request(self, method: str, params: dict, timeout: Optional[float]):
+        request_id = next(self._ids)
+        future: Future = Future()
+        self._pending[request_id] = future
+        try:
+            self._send({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise GeminiWorkerError(f"Gemini CLI did not answer '{method}' within {timeout}s")
+        finally:
+            self._pending.pop(request_id, None)
+
+    def _read_stdout(self):
+        for line in self.proc.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError:
+                self._stderr_tail.append(line)
+                continue
+            try:
+                self._dispatch(message)
+            except Exception as e:  # never let a bad message kill the reader
+                self._stderr_tail.append(f"dispatch error: {e}")
+        self.broken = True
+        self._fail_pending(f"Gemini CLI worker exited. {self.stderr_tail}".strip())
+
+    def _read_stderr(self):
+        for line in self.proc.stderr:
+            self._stderr_tail.append(line.rstrip())
+
+    def _dispatch(self, message: dict):
+        method = message.get("method")
+        if method is None:
+            future = self._pending.get(message.get("id"))
+            if future is None:
+                return
+            if "error" in message:
+                err = message["error"]
+                future.set_exception(GeminiWorkerError(err.get("message", str(err))))
+            else:
+                future.set_result(message.get("result") or {})
+            return
+
+        params = message.get("params") or {}
+        if method == "session/update":
+            update = params.get("update") or {}
+            content = update.get("content") or {}
+            session_id = params.get("sessionId")
+            chunks = self._chunks.get(session_id)
+            if update.get("sessionUpdate") == "agent_message_chunk" and chunks is not None:
+                if content.get("type") == "text":
+                    chunks.append(content.get("text", ""))
+                    listener = self._listeners.get(session_id)
+                    if listener is not None:
+                        listener(content.get("text", ""))
+        elif "id" in message:
+            self._answer_agent_request(message["id"], method, params)
+
+    def _answer_agent_request(self, request_id, method: str, params: dict):
+        if method == "session/request_permission":
+            # Nobody is there to confirm a tool call, so reject it unless approval was opted into,
+            # and never grant a standing "always" permission either way
+            options = params.get("options") or []
+            wanted = "allow_once" if self.auto_approve else "reject_once"
+            choice = next((o for o in options if o.get("kind") == wanted), None)
+            if choice is None:
+                outcome = {"outcome": "cancelled"}
+            else:
+                outcome = {"outcome": "selected", "optionId": choice["optionId"]}
+            self._send({"jsonrpc": "2.0", "id": request_id, "result": {"outcome": outcome}})
+        else:
+            self._send({"jsonrpc": "2.0", "id": request_id,
+                        "error": {"code": -32601, "message": f"Method not supported: {method}"}})
+
+    def _fail_pending(self, reason: str):
+        for future in list(self._pending.values()):
+            if not future.done():
+                future.set_exception(GeminiWorkerError(reason))
+
+
+class CancelToken:
+    """Lets another thread cancel a GeminiWorkerPool.call, e.g. when the awaiting task is cancelled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._worker: Optional[GeminiWorker] = None
+        self.cancelled = False
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            worker = self._worker
+        if worker is not None:
+            worker.cancel()
+
+    def _attach(self, worker: GeminiWorker) -> bool:
+        """Bind the worker running the call; False if the call was cancelled before it got one."""
+        with self._lock:
+            self._worker = worker
+            return not self.cancelled
+
+
+class GeminiWorkerPool:
+    """Fixed-size pool of pre-warmed Gemini CLI workers.
+
+    Workers are health-checked on checkout and by a background monitor, and are
+    recycled after `max_requests` prompts (or `max_age` seconds) so session
+    history and memory do not grow without bound. Every prompt runs in its own
+    ACP session unless `fresh_session` is turned off, so one user's prompt
+    never sees another's history. A replacement that fails to
+    start is retried with exponential backoff (`respawn_delay` up to
+    `respawn_max_delay`); while no worker is alive or starting, `call` raises
+    GeminiPoolUnavailable at once instead of waiting out its timeout.
+
+    Workers reject every tool permission request (shell, file edits, MCP tools
+    that are not trusted in settings.json) unless `auto_approve` is set, in
+    which case each request is allowed once.
+    """
+
+    def __init__(self, size: int = 2, max_requests: int = 50, max_age: Optional[float] = None,
+                 request_timeout: float = 300.0, startup_timeout: float = 60.0,
+                 health_interval: float = 30.0, cwd: Optional[str] = None,
+                 auto_approve: bool = False, fresh_session: bool = True,
+                 respawn_delay: float = 1.0, respawn_max_delay: float = 60.0,
+                 worker_factory: Optional[Callable[[], GeminiWorker]] = None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.size = size
+        self.max_requests = max_requests
+        self.max_age = max_age
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.fresh_session = fresh_session
+        self.respawn_delay = respawn_delay
+        self.respawn_max_delay = respawn_max_delay
+        self._worker_factory = worker_factory or (
+            lambda: GeminiWorker(cwd=cwd, auto_approve=auto_approve, startup_timeout=startup_timeout)
+        )
+
+        self._idle: "queue.Queue[GeminiWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        # Started workers not yet closed (idle or busy), and worker starts in progress
+        self._live = 0
+        self._starting = 0
+        self.stats = {"requests": 0, "errors": 0, "spawned": 0, "recycled": 0, "spawn_failures": 0}
+
+    def start(self):
+        """Warm up all workers in parallel. Raises if none of them could start."""
+        errors: List[Exception] = []
+        with self._lock:
+            self._starting += self.size
+        threads = [threading.Thread(target=self._spawn_into_pool, args=(errors,)) for _ in range(self.size)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self._idle.qsize() == 0:
+            raise GeminiWorkerError(f"No Gemini CLI worker could start: {errors[0] if errors else 'unknown error'}")
+        for _ in errors:
+            self._start_respawn()
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def call(self, prompt: str, timeout: Optional[float] = None,
+             on_chunk: Optional[Callable[[str], None]] = None,
+             cancel_token: Optional[CancelToken] = None) -> str:
+        """Run a prompt on a warm worker. Same contract as a one-shot `gemini -p` call.
+
+        Cancelling `cancel_token` stops the prompt with session/cancel, makes this
+        call raise GeminiWorkerError, and recycles the worker.
+        """
+        timeout = timeout or self.request_timeout
+        worker = self._checkout(timeout)
+        if cancel_token is not None and not cancel_token._attach(worker):
+            self._checkin(worker)
+            raise GeminiWorkerError("prompt cancelled")
+        with self._lock:
+            self.stats["requests"] += 1
+        try:
+            return worker.prompt(prompt, timeout=timeout, fresh_session=self.fresh_session, on_chunk=on_chunk)
+        except GeminiWorkerError:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            self._checkin(worker)
+
+    def close(self):
+        self._closed.set()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(worker)
+
+    # --- internals ---
+
+    def _healthy(self, worker: GeminiWorker) -> bool:
+        if not worker.is_alive():
+            return False
+        if self.max_requests and worker.requests >= self.max_requests:
+            return False
+        if self.max_age and worker.age >= self.max_age:
+            return False
+        return True
+
+    def _spawn_into_pool(self, errors: Optional[List[Exception]] = None) -> bool:
+        """Start one worker and add it to the idle queue. Returns False if it failed to start.
+
+        The caller counts the start in `_starting` beforehand, so a checkout
+        never sees a gap between a worker going away and its replacement starting.
+        """
+        if self._closed.is_set():
+            with self._lock:
+                self._starting -= 1
+            return False
+        worker = self._worker_factory()
+        try:
+            worker.start()
+        except GeminiWorkerError as e:
+            with self._lock:
+                self._starting -= 1
+                self.stats["spawn_failures"] += 1
+            if errors is not None:
+                errors.append(e)
+            return False
+        with self._lock:
+            self._starting -= 1
+            self._live += 1
+            self.stats["spawned"] += 1
+        if self._closed.is_set():
+            self._discard(worker)
+        else:
+            self._idle.put(worker)
+        return True
+
+    def _respawn(self):
+        """Start a replacement worker, retrying with exponential backoff until one runs."""
+        delay = self.respawn_delay
+        while not self._spawn_into_pool():
+            if self._closed.wait(delay):
+                return
+            delay = min(delay * 2, self.respawn_max_delay)
+            with self._lock:
+                self._starting += 1
+
+    def _start_respawn(self):
+        with self._lock:
+            self._starting += 1
+        threading.Thread(target=self._respawn, daemon=True).start()
+
+    def _discard(self, worker: GeminiWorker):
+        worker.close()
+        with self._lock:
+            self._live -= 1
+
+    def _replace(self, worker: GeminiWorker):
+        # Start the replacement first: closing a worker that is still busy can take seconds
+        self._start_respawn()
+        with self._lock:
+            self.stats["recycled"] += 1
+        self._discard(worker)
+
+    def _checkout(self, timeout: float) -> GeminiWorker:
+        deadline = time.monotonic() + timeout
+        while not self._closed.is_set():
+            with self._lock:
+                unavailable = self._live == 0 and self._starting == 0
+            if unavailable and self._idle.empty():
+                raise GeminiPoolUnavailable("No live Gemini CLI worker; replacements are failing to start")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # Wake up now and then to notice the last worker failing to come back
+                worker = self._idle.get(timeout=min(remaining, CHECKOUT_POLL))
+            except queue.Empty:
+                continue
+            if self._healthy(worker):
+                return worker
+            self._replace(worker)
+        raise GeminiWorkerError("No healthy Gemini CLI worker available")
+
+    def _checkin(self, worker: GeminiWorker):
+        if self._closed.is_set():
+            self._discard(worker)
+        elif self._healthy(worker):
+            self._idle.put(worker)
+        else:
+            self._replace(worker)
+
+    def _monitor(self):
+        """Periodically replace idle workers that died or aged out while waiting."""
+        while not self._closed.wait(self.health_interval):
+            for _ in range(self._idle.qsize()):
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if self._healthy(worker):
+                    self._idle.put(worker)
+                else:
+                    self._replace(worker)
@@ -0,0 +1,337 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from netflix_db import QueryBudget, QueryBudgetExceeded, QueryGuard
+
+# Full scans of tables at least this large are flagged
+LARGE_TABLE_ROWS = 10_000
+MAX_INDEX_COLUMNS = 4
+INDEX_PREFIX = "idx_advisor_"
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_CLAUSE = re.compile(r"\b(SELECT|FROM|WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|ON|JOIN|UNION)\b", re.I)
+_TABLE_REF = re.compile(r'^\s*"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.I)
+_PREDICATE = re.compile(
+    r'(?:"?(\w+)"?\.)?"?(\w+)"?\s*(==|=|!=|<>|<=|>=|<|>|\bIN\b|\bBETWEEN\b|\bLIKE\b|\bGLOB\b|\bIS\b)', re.I
+)
+_JOIN_PAIR = re.compile(r'"?(\w+)"?\."?(\w+)"?\s*==?\s*"?(\w+)"?\."?(\w+)"?')
+_IDENT = re.compile(r'(?:"?(\w+)"?\.)?"?(\w+)"?')
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(.*)$")
+_KEYWORDS = {"where", "join", "on", "inner", "left", "right", "outer", "cross", "natural", "group",
+             "order", "limit", "using", "union", "having", "as"}
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for a statement."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """Tables read by a full table scan (a scan of a covering index does not count)."""
+    tables = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match and "INDEX" not in match.group(2).upper():
+            tables.append(match.group(1))
+    return tables
+
+
+@dataclass
+class ColumnUsage:
+    # (table, column) -> Counter of kinds: eq, range, join, order, select
+    kinds: Dict[Tuple[str, str], Counter] = field(default_factory=lambda: defaultdict(Counter))
+    # alias -> table, as named in FROM/JOIN (query plans report tables by alias)
+    aliases: Dict[str, str] = field(default_factory=dict)
+
+    def add(self, table: str, column: str, kind: str):
+        self.kinds[(table, column)][kind] += 1
+
+    def index_columns(self, table: str, order: Dict[str, int]) -> Tuple[str, ...]:
+        """Index key for this statement: equality/join columns, then one range or ORDER BY column.
+
+        Equality columns are ordered by `order` (how often they are filtered across
+        the log) so that statements with overlapping filters share a prefix.
+        """
+        cols = {c: k for (t, c), k in self.kinds.items() if t == table}
+        eq = sorted((c for c, k in cols.items() if k["eq"] or k["join"]), key=lambda c: (-order.get(c, 0), c))
+        tail = [c for c, k in cols.items() if k["range"] and c not in eq] or \
+               [c for c, k in cols.items() if k["order"] and c not in eq]
+        return tuple(eq[:MAX_INDEX_COLUMNS - 1] + tail[:1])
+
+    def selected(self, table: str) -> List[str]:
+        return [c for (t, c), k in self.kinds.items() if t == table and k["select"]]
+
+
+def column_usage(sql: str, schema: Dict[str, List[str]]) -> ColumnUsage:
+    """Best-effort extraction of filtered, joined, ordered and selected columns from a statement.
+
+    This is a lexical pass, not a parser: it resolves `alias.column` and
+    unambiguous bare column names against the tables named in FROM/JOIN.
+    """
+    usage = ColumnUsage()
+    text = _STRING.sub("?", sql)
+    parts = _CLAUSE.split(text)
+
+    aliases = usage.aliases
+    tables: List[str] = []
+    clauses: List[Tuple[str, str]] = []
+    for i in range(1, len(parts) - 1, 2):
+        keyword = " ".join(parts[i].upper().split())
+        body = parts[i + 1]
+        clauses.append((keyword, body))
+        if keyword in ("FROM", "JOIN"):
+            for ref in body.split(","):
+                match = _TABLE_REF.match(ref)
+                if match and match.group(1) in schema:
+                    table = match.group(1)
+                    tables.append(table)
+                    aliases[table] = table
+                    alias = match.group(2)
+                    if alias and alias.lower() not in _KEYWORDS:
+                        aliases[alias] = table
+
+    def resolve(qualifier: Optional[str], column: str) -> Optional[str]:
+        if qualifier:
+            table = aliases.get(qualifier)
+            return table if table and column in schema.get(table, []) else None
+        owners = [t for t in set(tables) if column in schema.get(t, [])]
+        return owners[0] if len(owners) == 1 else None
+
+    for keyword, body in clauses:
+        if keyword in ("WHERE", "ON", "HAVING"):
+            for q1, c1, q2, c2 in _JOIN_PAIR.findall(body):
+                for qualifier, column in ((q1, c1), (q2, c2)):
+                    table = resolve(qualifier, column)
+                    if table:
+                        usage.add(table, column, "join")
+            body = _JOIN_PAIR.sub(" ", body)
+            for qualifier, column, op in _PREDICATE.findall(body):
+                table = resolve(qualifier, column)
+                if table:
+                    kind = "eq" if op.upper() in ("=", "==", "IN", "IS") else "range"
+                    usage.add(table, column, kind)
+        elif keyword in ("GROUP BY", "ORDER BY"):
+            for qualifier, column in _IDENT.findall(body):
+                table = resolve(qualifier, column)
+                if table:
+                    usage.add(table, column, "order")
+        elif keyword == "SELECT":
+            for qualifier, column in _IDENT.findall(body):
+                table = resolve(qualifier, column)
+                if table:
+                    usage.add(table, column, "select")
+    return usage
+
+
+@dataclass
+class QueryRecord:
+    sql: str
+    plan: List[str]
+    elapsed_ms: float
+    # Large tables read by a full scan
+    scans: List[str]
+    usage: ColumnUsage
+
+
+@dataclass
+class IndexProposal:
+    table: str
+    columns: List[str]
+    reason: str
+    sample_queries: List[str]
+
+    @property
+    def name(self) -> str:
+        return f"{INDEX_PREFIX}{self.table}_{'_'.join(self.columns)}"
+
+    @property
+    def ddl(self) -> str:
+        cols = ", ".join(f'"{c}"' for c in self.columns)
+        return f'CREATE INDEX IF NOT EXISTS "{self.name}" ON "{self.table}" ({cols})'
+
+
+def _serves(index: List[str], key: Tuple[str, ...], columns: List[str]) -> bool:
+    """True when `index` leads with `key` and holds all of `columns`, so it does the job of an index on them."""
+    return tuple(index[:len(key)]) == key and set(columns) <= set(index)
+
+
+class IndexAdvisor:
+    """Records the query plan of executed statements and proposes indexes for hot full scans."""
+
+    def __init__(self, db_path: str, log_size: int = 500, large_table_rows: int = LARGE_TABLE_ROWS):
+        self.db_path = db_path
+        self.large_table_rows = large_table_rows
+        self.log: deque = deque(maxlen=log_size)
+        self.usage: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+        self.scan_counts: Counter = Counter()
+        self._table_rows: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def _row_estimate(self, conn: sqlite3.Connection, table: str) -> int:
+        cached = self._table_rows.get(table)
+        if cached and time.monotonic() - cached[0] < 300:
+            return cached[1]
+        try:
+            # max(rowid) is an O(log n) estimate, unlike COUNT(*)
+            rows = conn.execute(f'SELECT max(rowid) FROM "{table}"').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            rows = 0
+        self._table_rows[table] = (time.monotonic(), rows)
+        return rows
+
+    def record(self, conn: sqlite3.Connection, sql: str, elapsed_ms: float, schema: Dict[str, List[str]]) -> QueryRecord:
+        """Explain an executed statement, flag large full scans and update column statistics."""
+        try:
+            plan = explain(conn, sql)
+        except sqlite3.Error:
+            plan = []
+        usage = column_usage(sql, schema)
+        scans = [usage.aliases.get(t, t) for t in full_scans(plan)]
+        scans = [t for t in dict.fromkeys(scans) if t in schema and self._row_estimate(conn, t) >= self.large_table_rows]
+        record = QueryRecord(sql, plan, elapsed_ms, scans, usage)
+        with self._lock:
+            self.log.append(record)
+            for table in scans:
+                self.scan_counts[table] += 1
+            for key, kinds in usage.kinds.items():
+                self.usage[key].update(kinds)
+        return record
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "analysed": len(self.log),
+                "with_large_scans": sum(1 for r in self.log if r.scans),
+                "scans_by_table": dict(self.scan_counts.most_common(10)),
+            }
+
+    def _existing_indexes(self, conn: sqlite3.Connection, table: str) -> List[List[str]]:
+        indexes = []
+        for row in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+            cols = [r[2] for r in conn.execute(f'PRAGMA index_info("{row[1]}")').fetchall()]
+            indexes.append(cols)
+        return indexes
+
+    def proposals(self, conn: sqlite3.Connection, per_table: int = 2) -> List[IndexProposal]:
+        """Index proposals for the tables most often fully scanned.
+
+        Filter shapes that share a prefix are folded into one candidate, and
+        candidates are ranked by how often their leading column is filtered or
+        sorted on, then by how many scans they cover.
+        """
+        with self._lock:
+            scan_counts = dict(self.scan_counts)
+            usage = {k: Counter(v) for k, v in self.usage.items()}
+            log = list(self.log)
+
+        proposals = []
+        for table, scans in sorted(scan_counts.items(), key=lambda kv: -kv[1]):
+            filtered = {c: k["eq"] + k["join"] for (t, c), k in usage.items() if t == table}
+            shapes: Counter = Counter()
+            samples: Dict[Tuple[str, ...], List[str]] = defaultdict(list)
+            selected: Dict[Tuple[str, ...], Counter] = defaultdict(Counter)
+            for record in reversed(log):
+                if table not in record.scans:
+                    continue
+                key = record.usage.index_columns(table, filtered)
+                if not key:
+                    continue
+                shapes[key] += 1
+                samples[key].append(record.sql)
+                selected[key].update(c for c in record.usage.selected(table) if c not in key)
+
+            # Fold each shape into a longer shape it is a prefix of, since one index serves both:
+            # (country,) and (country, release_year) become one candidate
+            members: Dict[Tuple[str, ...], List[Tuple[str, ...]]] = {}
+            for key in sorted(shapes, key=lambda k: (-len(k), -shapes[k], k)):
+                longer = [c for c in members if c[:len(key)] == key]
+                target = max(longer, key=lambda c: (shapes[c], c)) if longer else key
+                members.setdefault(target, []).append(key)
+            # Filter and sort frequency of each column across all statements on this table
+            lead_weight = {c: k["eq"] + k["join"] + k["range"] + k["order"] for (t, c), k in usage.items() if t == table}
+            candidates = sorted(
+                members, key=lambda c: (-lead_weight.get(c[0], 0), -sum(shapes[m] for m in members[c]), c)
+            )
+
+            existing = self._existing_indexes(conn, table)
+            planned: List[Tuple[Tuple[str, ...], IndexProposal]] = []
+            for key in candidates[:per_table]:
+                if any(tuple(idx[:len(key)]) == key for idx in existing):
+                    continue
+                count = sum(shapes[m] for m in members[key])
+                queries = [sql for m in members[key] for sql in samples[m]]
+                wanted: Counter = Counter()
+                for m in members[key]:
+                    wanted.update({c: n for c, n in selected[m].items() if c not in key})
+                columns = list(key)
+                # Extend to a covering index when the selected columns still fit
+                extra = [c for c, _ in wanted.most_common()]
+                if len(columns) + len(extra) <= MAX_INDEX_COLUMNS:
+                    columns += extra
+                # Index proposals in one run must not make each other redundant
+                if any(_serves(p.columns, key, columns) for _, p in planned):
+                    continue
+                planned = [(k, p) for k, p in planned if not _serves(columns, k, p.columns)]
+                describe = ", ".join(
+                    f"{c} ({'/'.join(f'{kind} x{n}' for kind, n in usage[(table, c)].most_common() if kind != 'select')})"
+                    for c in key
+                )
+                planned.append((key, IndexProposal(
+                    table, columns, f"{count} of {scans} full scan(s) filter on {describe}", queries[:3]
+                )))
+            proposals.extend(p for _, p in planned)
+        return proposals
+
+    def report(self, apply: bool = False) -> str:
+        """Plan statistics and index proposals. With `apply`, create the indexes and time the sample queries."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            proposals = self.proposals(conn)
+            with self._lock:
+                analysed = len(self.log)
+                flagged = sum(1 for r in self.log if r.scans)
+            lines = [f"Index advisor: {analysed} queries analysed, {flagged} with full scans of large tables."]
+            if not proposals:
+                lines.append("No index proposals.")
+            # Time every sample before creating any index, so no baseline already benefits from one
+            before = [self._time_samples(conn, p.sample_queries) if apply else None for p in proposals]
+            for proposal, baseline in zip(proposals, before):
+                lines.append("")
+                lines.append(f"Table {proposal.table} (~{self._row_estimate(conn, proposal.table):,} rows): {proposal.reason}")
+                lines.append(f"  proposed: {proposal.ddl}")
+                if apply:
+                    lines.append("  " + self._apply(conn, proposal, baseline))
+            return "\n".join(lines)
+        finally:
+            conn.close()
+
+    def _time_samples(self, conn: sqlite3.Connection, queries: List[str]) -> Optional[float]:
+        total = 0.0
+        for sql in queries:
+            guard = QueryGuard(QueryBudget())
+            try:
+                with guard.running(conn):
+                    for _ in conn.execute(sql):
+                        pass
+            except (QueryBudgetExceeded, sqlite3.Error):
+                return None
+            total += guard.elapsed
+        return total * 1000
+
+    def _apply(self, conn: sqlite3.Connection, proposal: IndexProposal, before: Optional[float]) -> str:
+        try:
+            conn.execute(proposal.ddl)
+            conn.execute(f'ANALYZE "{proposal.table}"')
+            conn.commit()
+        except sqlite3.Error as e:
+            return f"[not applied] {e}"
+        after = self._time_samples(conn, proposal.sample_queries)
+        if before is None or after is None:
+            return f"[applied] {proposal.name} (sample queries could not be timed)"
+        return (f"[applied] {proposal.name}: {len(proposal.sample_queries)} sample query(s) "
+                f"{before:.1f} ms before -> {after:.1f} ms after")
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+def read_schema(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """Table name -> column names, straight from sqlite_master and PRAGMA table_info.
+
+    SQLite's internal tables (sqlite_sequence, sqlite_stat1 from ANALYZE, ...) are left out.
+    """
+    cursor = conn.cursor()
+    schema = {}
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\';")
+    tables = [row[0] for row in cursor.fetchall()]
+    for table in tables:
+        cursor.execute(f'PRAGMA table_info("{table}")')
+        schema[table] = [col[1] for col in cursor.fetchall()]
+    return schema
+
+
+@dataclass(frozen=True)
+class SchemaSnapshot:
+    schema: Dict[str, List[str]]
+    # JSON fragment embedded in the NL-to-SQL prompt
+    prompt_json: str
+    # (file mtime in ns, PRAGMA schema_version) the snapshot was taken at
+    version: Tuple[int, int]
+
+    @property
+    def digest(self) -> str:
+        """Stable hash of the schema, for keying anything derived from it."""
+        return hashlib.sha256(self.prompt_json.encode("utf-8")).hexdigest()[:16]
+
+
+class SchemaCache:
+    """Caches the database schema and its prompt fragment until the schema changes.
+
+    Each lookup costs one os.stat() and one PRAGMA schema_version on a connection
+    that stays open; the full schema is only re-read when either value moves.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._snapshot: Optional[SchemaSnapshot] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def _version(self) -> Tuple[int, int]:
+        mtime = os.stat(self.db_path).st_mtime_ns
+        schema_version = self._connection().execute("PRAGMA schema_version").fetchone()[0]
+        return mtime, schema_version
+
+    def get(self) -> SchemaSnapshot:
+        with self._lock:
+            version = self._version()
+            if self._snapshot is None or self._snapshot.version != version:
+                schema = read_schema(self._connection())
+                self._snapshot = SchemaSnapshot(schema, json.dumps(schema, indent=2), version)
+            return self._snapshot
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ConnectionPool:
+    """Bounded pool of read-only SQLite connections with a matching worker thread pool.
+
+    Connections are opened with mode=ro and PRAGMA query_only, a large page cache
+    and memory-mapped I/O. They run in autocommit mode, so every statement is its
+    own short read transaction and never pins a WAL snapshot. `run()` executes
+    work on the worker threads so concurrent tool calls can scan the database in
+    parallel without blocking the event loop.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, mmap_size: int = 256 * 1024 * 1024,
+                 cache_size_kib: int = 64 * 1024, cached_statements: int = 256):
+        self.db_path = db_path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.cached_statements = cached_statements
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="netflix-sql")
+
+    def _open(self) -> sqlite3.Connection:
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection, opening a new one while the pool is below its size."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def _call(self, fn: Callable[..., Any], args: tuple) -> Any:
+        with self.connection() as conn:
+            return fn(conn, *args)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(conn, *args) on a worker thread with a pooled connection."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    # Wall-clock seconds a single statement may run
+    time_limit: float = 5.0
+    # SQLite VM instructions a single statement may execute
+    max_vm_steps: int = 200_000_000
+    # Rows a single statement may hand back to be kept: a page of rows or a summary
+    # sample. Rows skipped to reach an offset or only counted are bounded by the
+    # time and VM-step limits instead
+    max_rows: int = 100_000
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, reason: str, elapsed: float, steps: int):
+        super().__init__(f"{reason} after {elapsed:.2f}s (~{steps:,} VM steps)")
+        self.reason = reason
+        self.elapsed = elapsed
+        self.steps = steps
+
+
+class QueryGuard:
+    """Enforces a QueryBudget on one statement through SQLite's progress handler.
+
+    The handler runs every CHECK_EVERY VM instructions and aborts the statement
+    (SQLite raises "interrupted") once the time or step limit is hit, or when
+    `cancel()` is called from another thread. Row limits are enforced by the
+    fetch loops through `count_rows()`.
+    """
+
+    CHECK_EVERY = 1000
+
+    def __init__(self, budget: QueryBudget):
+        self.budget = budget
+        self.steps = 0
+        self.rows = 0
+        self.elapsed = 0.0
+        self.reason: Optional[str] = None
+        # ok | error | timeout | cancelled, set by the code running the statement
+        self.outcome = "ok"
+        self._started = 0.0
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _progress(self) -> int:
+        self.steps += self.CHECK_EVERY
+        if self._cancelled:
+            self.reason = "cancelled"
+        elif time.perf_counter() - self._started > self.budget.time_limit:
+            self.reason = f"time limit of {self.budget.time_limit:g}s exceeded"
+        elif self.steps > self.budget.max_vm_steps:
+            self.reason = f"limit of {self.budget.max_vm_steps:,} VM steps exceeded"
+        return 1 if self.reason else 0
+
+    def count_rows(self, n: int):
+        self.rows += n
+        if self.rows > self.budget.max_rows:
+            self.reason = f"limit of {self.budget.max_rows:,} rows exceeded"
+            raise QueryBudgetExceeded(self.reason, time.perf_counter() - self._started, self.steps)
+
+    @contextmanager
+    def running(self, conn: sqlite3.Connection) -> Iterator["QueryGuard"]:
+        self._started = time.perf_counter()
+        conn.set_progress_handler(self._progress, self.CHECK_EVERY)
+        try:
+            yield self
+        except sqlite3.OperationalError as e:
+            if self.reason is None:
+                raise
+            raise QueryBudgetExceeded(self.reason, time.perf_counter() - self._started, self.steps) from e
+        finally:
+            conn.set_progress_handler(None, 0)
+            self.elapsed = time.perf_counter() - self._started
+
+
+class QueryStats:
+    """Aggregate and recent per-query runtime metrics."""
+
+    def __init__(self, recent: int = 50):
+        self.totals = {"queries": 0, "ok": 0, "error": 0, "timeout": 0, "cancelled": 0,
+                       "total_ms": 0.0, "max_ms": 0.0}
+        self.recent: deque = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record(self, query: str, guard: QueryGuard):
+        elapsed_ms = guard.elapsed * 1000
+        with self._lock:
+            self.totals["queries"] += 1
+            self.totals[guard.outcome] = self.totals.get(guard.outcome, 0) + 1
+            self.totals["total_ms"] += elapsed_ms
+            self.totals["max_ms"] = max(self.totals["max_ms"], elapsed_ms)
+            self.recent.append({
+                "sql": query[:200],
+                "outcome": guard.outcome,
+                "ms": round(elapsed_ms, 2),
+                "vm_steps": guard.steps,
+                "rows": guard.rows,
+            })
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            totals = dict(self.totals)
+            totals["total_ms"] = round(totals["total_ms"], 2)
+            totals["max_ms"] = round(totals["max_ms"], 2)
+            totals["avg_ms"] = round(totals["total_ms"] / totals["queries"], 2) if totals["queries"] else 0.0
+            return {"totals": totals, "recent": list(self.recent)[-10:]}
@@ -1,61 +1,319 @@
 import asyncio
 import json
+import os
+import shutil
 import sqlite3
+import sys
+import time
 from pathlib import Path
 from fastmcp import FastMCP
 
+from netflix_advisor import IndexAdvisor
+from netflix_db import ConnectionPool, QueryBudget, QueryBudgetExceeded, QueryGuard, QueryStats, SchemaCache
+from netflix_profile import ColumnProfileStore
+from netflix_results import (
+    FORMATS, ResultCache, canonical_sql, decode_page_token, encode_page_token, encode_rows, fetch_page, serialize_summary, summarize_query,
+)
+from netflix_schema_index import SchemaIndexCache
+from netflix_search import FullTextIndex, hit_records
+from netflix_sql_cache import SQLTranslationCache
+from netflix_templates import TemplateMatcher
+
 DB_PATH = r"C:\TCS\GeminiStreamlit\netflixdb.sqlite"
+SQL_CACHE_PATH = os.getenv("NETFLIX_SQL_CACHE_PATH", str(Path(__file__).with_name("netflix_sql_cache.sqlite")))
+SEARCH_INDEX_PATH = os.getenv("NETFLIX_SEARCH_INDEX_PATH", str(Path(__file__).with_name("netflix_search.sqlite")))
+PROFILE_PATH = os.getenv("NETFLIX_PROFILE_PATH", str(Path(__file__).with_name("netflix_profile.sqlite")))
+# Rows returned per call; larger results continue with netflix_next_page
+PAGE_SIZE = int(os.getenv("NETFLIX_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = 1000
+# Execution budget for every statement, so runaway LLM-generated SQL fails fast
+QUERY_BUDGET = QueryBudget(
+    time_limit=float(os.getenv("NETFLIX_QUERY_TIMEOUT", "5")),
+    max_vm_steps=int(os.getenv("NETFLIX_QUERY_MAX_STEPS", "200000000")),
+    max_rows=int(os.getenv("NETFLIX_QUERY_MAX_ROWS", "100000")),
+)
+# Memory budget for rendered results of repeated statements; 0 disables the result cache
+RESULT_CACHE_MB = float(os.getenv("NETFLIX_RESULT_CACHE_MB", "64"))
+# Largest netflix_batch call, and how many of its questions may wait on Gemini at once
+MAX_BATCH_ITEMS = int(os.getenv("NETFLIX_BATCH_MAX_ITEMS", "20"))
+BATCH_GEMINI_CONCURRENCY = int(os.getenv("NETFLIX_BATCH_GEMINI_CONCURRENCY", "4"))
+# Prompt only the tables relevant to the question; set NETFLIX_SCHEMA_PRUNING=0 to always send all of them
+SCHEMA_PRUNING = os.getenv("NETFLIX_SCHEMA_PRUNING", "1") != "0"
+SCHEMA_TOP_K = int(os.getenv("NETFLIX_SCHEMA_TOP_K", "4"))
+# Answer common question shapes from SQL templates instead of Gemini; set NETFLIX_TEMPLATES=0 to disable
+TEMPLATES = os.getenv("NETFLIX_TEMPLATES", "1") != "0"
+# Seconds to wait for the Gemini CLI to write SQL before it is killed
+GEMINI_TIMEOUT = float(os.getenv("NETFLIX_GEMINI_TIMEOUT", "120"))
+
+# Schema and its prompt fragment, rebuilt only when PRAGMA schema_version or the file mtime changes
+schema_cache = SchemaCache(DB_PATH)
+
+# Per-column type, cardinality, range and common values, precomputed off the request path
+column_profiles = ColumnProfileStore(DB_PATH, PROFILE_PATH)
+
+# FTS5 index over the text columns (titles, descriptions, ...) for netflix_search
+search_index = FullTextIndex(DB_PATH, SEARCH_INDEX_PATH)
+
+# BM25 index over table names, column names and sampled values, for schema pruning
+schema_index = SchemaIndexCache()
+
+# Read-only connections shared by all tool calls; queries run on the pool's worker threads
+db_pool = ConnectionPool(DB_PATH, size=4)
+
+# Question -> SQL translations, so repeated questions skip the Gemini round trip
+# Reusing SQL for reworded questions is opt-in (NETFLIX_SQL_CACHE_FUZZY=1)
+sql_cache = SQLTranslationCache(SQL_CACHE_PATH, near_duplicates=os.getenv("NETFLIX_SQL_CACHE_FUZZY", "0") == "1")
+
+# Rendered pages keyed by canonical SQL, dropped whenever the database's data_version or mtime moves
+result_cache = ResultCache(DB_PATH, max_bytes=int(RESULT_CACHE_MB * 1024 * 1024))
+
+# Question shapes such as "top 10 movies by rating", checked against the schema and column profiles
+template_matcher = TemplateMatcher()
+
+query_stats = QueryStats()
+
+# Query plans of executed statements, used to flag full scans and propose indexes
+index_advisor = IndexAdvisor(DB_PATH, large_table_rows=int(os.getenv("NETFLIX_LARGE_TABLE_ROWS", "10000")))
+
+# Results starting with these are errors; netflix_batch reports them under "error"
+_ERROR_PREFIXES = ("SQL Error", "Query aborted", "[Gemini Error]", "[Batch Error]")
+batch_questions = asyncio.Semaphore(BATCH_GEMINI_CONCURRENCY)
 
 def get_db_schema():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    schema = {}
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = [row[0] for row in cursor.fetchall()]
-    for table in tables:
-        cursor.execute(f"PRAGMA table_info({table})")
-        cols = [col[1] for col in cursor.fetchall()]
-        schema[table] = cols
-    conn.close()
-    return schema
-
-def execute_sql(query: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    return schema_cache.get().schema
+
+def run_sql(conn: sqlite3.Connection, query: str, offset: int = 0, page_size: int = PAGE_SIZE,
+            output_format: str = "auto", guard: QueryGuard = None):
+    guard = guard or QueryGuard(QUERY_BUDGET)
+    if output_format not in FORMATS:
+        guard.outcome = "error"
+        return f"SQL Error: unknown output format '{output_format}', expected one of {', '.join(FORMATS)}"
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
     try:
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        columns = [d[0] for d in cursor.description] if cursor.description else []
-        conn.close()
-        if not rows:
-            return "No results found."
-        return json.dumps([dict(zip(columns, row)) for row in rows], indent=2)
+        with guard.running(conn):
+            if output_format == "summary":
+                columns, sample, total = summarize_query(conn, query, guard=guard)
+                return serialize_summary(columns, sample, total) if total else "No results found."
+            page = fetch_page(conn, query, offset, page_size, guard=guard)
+    except QueryBudgetExceeded as e:
+        guard.outcome = "cancelled" if e.reason == "cancelled" else "timeout"
+        return f"Query aborted: {e}. Narrow the query (filters, LIMIT, fewer joins) and try again."
     except Exception as e:
-        conn.close()
+        guard.outcome = "error"
         return f"SQL Error: {e}"
+    if not page.rows:
+        return "No results found." if offset == 0 else "No more results."
 
-mcp = FastMCP("Netflix MCP Server")
+    body = encode_rows(page.columns, page.rows, output_format)
+    first, last = offset + 1, offset + len(page.rows)
+    if page.next_offset is None:
+        return body if offset == 0 else f"{body}\n\n(rows {first}-{last}, end of results)"
+    token = encode_page_token(query, page.next_offset, page_size, output_format)
+    return (f"{body}\n\n(rows {first}-{last}; more rows available: "
+            f"call netflix_next_page with page_token=\"{token}\")")
+
+async def execute_sql(query: str, offset: int = 0, page_size: int = PAGE_SIZE, output_format: str = "auto",
+                      analyze: bool = False):
+    result, _ = await execute_sql_with_outcome(query, offset, page_size, output_format, analyze)
+    return result
+
+async def execute_sql_with_outcome(query: str, offset: int = 0, page_size: int = PAGE_SIZE,
+                                   output_format: str = "auto", analyze: bool = False):
+    """execute_sql, also returning the guard outcome: ok, error, timeout or cancelled."""
+    key = (canonical_sql(query), offset, page_size, output_format)
+    if RESULT_CACHE_MB > 0:
+        cached = result_cache.get(key)
+        if cached is not None:
+            # Only results that ran to completion are cached
+            return cached, "ok"
+
+    guard = QueryGuard(QUERY_BUDGET)
+    try:
+        result = await db_pool.run(run_sql, query, offset, page_size, output_format, guard)
+    except asyncio.CancelledError:
+        # The tool call went away; stop the statement at the next progress-handler tick
+        guard.cancel()
+        guard.outcome = "cancelled"
+        raise
+    finally:
+        query_stats.record(query, guard)
+    if RESULT_CACHE_MB > 0 and guard.outcome == "ok":
+        result_cache.set(key, result)
+    if analyze and guard.outcome == "ok":
+        try:
+            await db_pool.run(index_advisor.record, query, guard.elapsed * 1000, get_db_schema())
+        except Exception as e:
+            print(f"Query plan not recorded: {e}", file=sys.stderr)
+    return result, guard.outcome
+
+async def generate_sql(prompt: str, timeout: float = GEMINI_TIMEOUT):
+    """Ask the Gemini CLI for SQL without blocking the event loop. Returns (sql, error).
+
+    The subprocess is killed when it overruns `timeout` or the caller is cancelled.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        shutil.which("gemini") or "gemini", "-p", prompt,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None, f"Gemini CLI timed out after {timeout:g}s"
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    if proc.returncode != 0:
+        return None, stderr.decode(errors="replace").strip()
+    return stdout.decode(errors="replace").strip(), None
+
+async def answer_question(query: str, page_size: int = PAGE_SIZE, output_format: str = "auto") -> str:
+    """Translate a question to SQL (cache, template or Gemini) and run it."""
+    schema = schema_cache.get()
+    sql = sql_cache.lookup(query, schema.digest)
+    if sql is not None:
+        res = await execute_sql(sql, page_size=page_size, output_format=output_format, analyze=True)
+        return f"SQL:\n{sql}\n\nResult:\n{res}"
+
+    # Profiles come from the side store; a changed database is re-profiled in the background
+    column_profiles.refresh_in_background()
+    if TEMPLATES:
+        template = template_matcher.match(query, schema.schema, column_profiles.profiles())
+        if template is not None:
+            res = await execute_sql(template.sql, page_size=page_size, output_format=output_format, analyze=True)
+            return f"SQL:\n{template.sql}\n\nResult:\n{res}"
+
+    schema_json, tables = schema.prompt_json, list(schema.schema)
+    if SCHEMA_PRUNING:
+        selection = await db_pool.run(schema_index.select, schema, query, SCHEMA_TOP_K)
+        schema_json, tables = selection.prompt_json, list(selection.schema)
+
+    profile = column_profiles.prompt_fragment(tables)
+    if profile:
+        schema_json += f"\nColumn profiles (type, distinct values, then common values or min .. max):\n{profile}"
 
-@mcp.tool
-async def query_netflix(query: str) -> str:
-    """Query the Netflix database using natural language."""
-    schema = get_db_schema()
     prompt = f"""
 You are a SQLite SQL generator. Schema:
-{json.dumps(schema, indent=2)}
+{schema_json}
 User query: "{query}"
 Convert the corresponding natural language text into SQLite compatibel query and return the result.
 """
-    from subprocess import run, PIPE
-    print("Converting to SQL")
-    result = run(["gemini", "-p", prompt], stdout=PIPE, stderr=PIPE, text=True, shell=True)
-    if result.returncode != 0:
-        return f"[Gemini Error] {result.stderr.strip()}"
-
-    sql = result.stdout.strip()
-    print(sql)
-    res = execute_sql(sql)
+    # stdout carries the MCP protocol, so progress goes to stderr
+    print("Converting to SQL", file=sys.stderr)
+    sql, error = await generate_sql(prompt)
+    if error is not None:
+        return f"[Gemini Error] {error}"
+
+    print(sql, file=sys.stderr)
+    res, outcome = await execute_sql_with_outcome(sql, page_size=page_size, output_format=output_format, analyze=True)
+    # Only remember translations that ran to completion
+    if outcome == "ok":
+        sql_cache.store(query, schema.digest, sql)
     return f"SQL:\n{sql}\n\nResult:\n{res}"
 
+async def run_batch_item(index: int, kind: str, item: str, page_size: int, output_format: str) -> dict:
+    """Run one batch item; `kind` is "sql" for a statement or "question" for natural language."""
+    started = time.perf_counter()
+    try:
+        if kind == "sql":
+            result = await execute_sql(item, page_size=page_size, output_format=output_format)
+        else:
+            async with batch_questions:
+                result = await answer_question(item, page_size, output_format)
+    except Exception as e:
+        result = f"[Batch Error] {e}"
+    entry = {"index": index, "kind": kind, "ms": round((time.perf_counter() - started) * 1000, 2)}
+    body = result.split("\n\nResult:\n", 1)[-1]
+    if body.startswith(_ERROR_PREFIXES) or result.startswith(_ERROR_PREFIXES):
+        entry["error"] = result
+    else:
+        entry["result"] = result
+    return entry
+
+mcp = FastMCP("Netflix MCP Server")
+
+@mcp.tool
+async def query_netflix(query: str, page_size: int = PAGE_SIZE, output_format: str = "auto") -> str:
+    """Query the Netflix database using natural language.
+
+    Returns at most `page_size` rows; use netflix_next_page with the returned token for more.
+    `output_format` is one of: auto (row objects for small results, columnar for large ones),
+    json, columnar, csv, tsv, or summary (row count plus a sample).
+    """
+    return await answer_question(query, page_size, output_format)
+
+@mcp.tool
+async def netflix_batch(statements: list[str] | None = None, questions: list[str] | None = None,
+                        page_size: int = PAGE_SIZE, output_format: str = "auto") -> str:
+    """Run several SQL statements and/or natural-language questions in one call.
+
+    `statements` are run as SQL as given; `questions` are translated to SQL first,
+    like query_netflix. Items run in parallel on the connection pool. Returns a
+    JSON array, statements first and then questions, each in input order with its
+    kind (sql or question), index within its list, time in ms, and either its
+    result or its error. At most MAX_BATCH_ITEMS items per call.
+    """
+    statements, questions = statements or [], questions or []
+    total = len(statements) + len(questions)
+    if not total:
+        return "[]"
+    if total > MAX_BATCH_ITEMS:
+        return f"[Batch Error] {total} items given, at most {MAX_BATCH_ITEMS} allowed."
+    started = time.perf_counter()
+    entries = await asyncio.gather(
+        *(run_batch_item(i, "sql", item, page_size, output_format) for i, item in enumerate(statements)),
+        *(run_batch_item(i, "question", item, page_size, output_format) for i, item in enumerate(questions)),
+    )
+    return json.dumps({"total_ms": round((time.perf_counter() - started) * 1000, 2), "items": entries}, indent=2)
+
+@mcp.tool
+async def netflix_next_page(page_token: str) -> str:
+    """Fetch the next page of rows for a previous query_netflix result."""
+    try:
+        sql, offset, page_size, output_format = decode_page_token(page_token)
+    except ValueError as e:
+        return str(e)
+    return await execute_sql(sql, offset, page_size, output_format)
+
+@mcp.tool
+async def netflix_search(text: str, limit: int = 10, table: str = "") -> str:
+    """Keyword search over titles, descriptions and other text columns, best matches first.
+
+    Prefer this over query_netflix for finding titles by words in their name or
+    description. `table` restricts the search to one table.
+    """
+    hits = await asyncio.to_thread(search_index.search, text, max(1, min(limit, 100)), table or None)
+    if not hits:
+        return "No matches found."
+    records = await db_pool.run(hit_records, hits)
+    return "[\n  " + ",\n  ".join(json.dumps(r, default=str) for r in records) + "\n]"
+
+@mcp.tool
+async def netflix_stats() -> str:
+    """Cache and performance statistics for the Netflix MCP server."""
+    stats = {
+        "sql_cache": dict(sql_cache.stats, hit_rate=round(sql_cache.hit_rate(), 3)),
+        "schema_pruning": dict(schema_index.stats),
+        "column_profiles": dict(column_profiles.stats),
+        "templates": dict(template_matcher.stats),
+        "search": dict(search_index.stats),
+        "result_cache": result_cache.snapshot(),
+        "queries": query_stats.snapshot(),
+        "query_plans": index_advisor.stats(),
+    }
+    return json.dumps(stats, indent=2)
+
+@mcp.tool
+async def netflix_index_advice(apply: bool = False) -> str:
+    """Report full scans of large tables seen in query_netflix plans and propose covering indexes.
+
+    With `apply=True` the proposed indexes are created and the sample queries that
+    triggered them are timed before and after.
+    """
+    return await asyncio.to_thread(index_advisor.report, apply)
+
 if __name__ == "__main__":
     mcp.run(transport="stdio")
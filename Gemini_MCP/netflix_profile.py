@@ -0,0 +1,239 @@
+"""Column profiles for the Netflix database, kept in a side SQLite file.
+
+Run directly to profile a database offline:
+
+    python netflix_profile.py [path_to_sqlite_db] [profile_store]
+
+The MCP server refreshes the store in the background when PRAGMA data_version
+or the database file's mtime moves, and only re-profiles tables whose
+fingerprint (row count, largest rowid and content digest) changed.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from netflix_db import read_schema
+
+TOP_VALUES = 5
+# Columns with more distinct values than this get min/max only, no top values
+TOP_VALUES_MAX_DISTINCT = 200
+MAX_VALUE_CHARS = 40
+# Rows hashed per fetch when fingerprinting a table
+DIGEST_BATCH = 1000
+
+
+@dataclass
+class ColumnProfile:
+    table: str
+    column: str
+    # Dominant storage class: integer, real, text, blob or null
+    type: str
+    rows: int
+    nulls: int
+    distinct: int
+    min: Any
+    max: Any
+    top_values: List[Any]
+
+    def describe(self) -> str:
+        """One compact prompt line, e.g. `titles.type text, 2 distinct: "Movie", "TV Show"`.
+
+        Low-cardinality text columns list their common values; everything else its range.
+        """
+        line = f"{self.table}.{self.column} {self.type}, {self.distinct} distinct"
+        if self.nulls:
+            line += f", {self.nulls * 100 // max(self.rows, 1)}% null"
+        if self.top_values and self.type == "text":
+            line += ": " + ", ".join(json.dumps(v) for v in self.top_values)
+        elif self.min is not None:
+            line += f", {json.dumps(self.min)} .. {json.dumps(self.max)}"
+        return line
+
+
+def _short(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > MAX_VALUE_CHARS:
+        return value[:MAX_VALUE_CHARS] + "..."
+    return value
+
+
+def profile_column(conn: sqlite3.Connection, table: str, column: str) -> ColumnProfile:
+    col = f'"{column}"'
+    types = conn.execute(
+        f'SELECT typeof({col}) AS t, count(*) AS n FROM "{table}" GROUP BY t ORDER BY n DESC'
+    ).fetchall()
+    rows = sum(n for _, n in types)
+    nulls = sum(n for t, n in types if t == "null")
+    dominant = next((t for t, _ in types if t != "null"), "null")
+    distinct, lo, hi = conn.execute(f'SELECT count(DISTINCT {col}), min({col}), max({col}) FROM "{table}"').fetchone()
+    top: List[Any] = []
+    if 0 < distinct <= TOP_VALUES_MAX_DISTINCT:
+        top = [_short(v) for v, in conn.execute(
+            f'SELECT {col} FROM "{table}" WHERE {col} IS NOT NULL GROUP BY {col} ORDER BY count(*) DESC LIMIT {TOP_VALUES}'
+        )]
+    return ColumnProfile(table, column, dominant, rows, nulls, distinct, _short(lo), _short(hi), top)
+
+
+def content_digest(conn: sqlite3.Connection, table: str, max_rowid: Optional[int] = None) -> str:
+    """Hash of every row in rowid order, optionally only up to `max_rowid`."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        where = f" WHERE rowid <= {int(max_rowid)}" if max_rowid is not None else ""
+        cursor = conn.execute(f'SELECT rowid, * FROM "{table}"{where} ORDER BY rowid')
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID table: primary key order
+        cursor = conn.execute(f'SELECT * FROM "{table}"')
+    while True:
+        batch = cursor.fetchmany(DIGEST_BATCH)
+        if not batch:
+            return digest.hexdigest()
+        digest.update(repr(batch).encode("utf-8", "surrogatepass"))
+
+
+def table_fingerprint(conn: sqlite3.Connection, table: str) -> str:
+    """Change detector for one table: row count, largest rowid and a content digest.
+
+    Count and rowid alone miss UPDATEs, so the digest covers the values as well.
+    """
+    try:
+        count, max_rowid = conn.execute(f'SELECT count(*), max(rowid) FROM "{table}"').fetchone()
+    except sqlite3.OperationalError:
+        # WITHOUT ROWID table
+        count, max_rowid = conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0], None
+    return f"{count}:{max_rowid}:{content_digest(conn, table)}"
+
+
+class ColumnProfileStore:
+    """Per-column profiles persisted in a side database, refreshed table by table."""
+
+    def __init__(self, db_path: str, store_path: str):
+        self.db_path = db_path
+        self._db_key = str(Path(db_path).resolve())
+        self._store = sqlite3.connect(store_path, check_same_thread=False)
+        self._store.execute("PRAGMA journal_mode=WAL")
+        self._store.execute(
+            "CREATE TABLE IF NOT EXISTS column_profile ("
+            " db TEXT NOT NULL, tbl TEXT NOT NULL, col TEXT NOT NULL, type TEXT, rows INTEGER,"
+            " nulls INTEGER, distinct_count INTEGER, min_value TEXT, max_value TEXT, top_values TEXT,"
+            " position INTEGER, profiled REAL, PRIMARY KEY (db, tbl, col))"
+        )
+        self._store.execute(
+            "CREATE TABLE IF NOT EXISTS table_fingerprint ("
+            " db TEXT NOT NULL, tbl TEXT NOT NULL, fingerprint TEXT NOT NULL, PRIMARY KEY (db, tbl))"
+        )
+        self._store.commit()
+        self._source: Optional[sqlite3.Connection] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._cache: Optional[Dict[str, List[ColumnProfile]]] = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self.stats = {"refreshes": 0, "tables_profiled": 0, "last_refresh_ms": 0.0}
+
+    def _source_connection(self) -> sqlite3.Connection:
+        if self._source is None:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            self._source = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return self._source
+
+    def _current_version(self) -> Tuple[int, int]:
+        mtime = os.stat(self.db_path).st_mtime_ns
+        return mtime, self._source_connection().execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """Re-profile the tables whose fingerprint changed. Returns the tables profiled."""
+        with self._refreshing:
+            started = time.perf_counter()
+            conn = self._source_connection()
+            version = self._current_version()
+            schema = {t: cols for t, cols in read_schema(conn).items() if not t.startswith("sqlite_")}
+            known = dict(self._store.execute(
+                "SELECT tbl, fingerprint FROM table_fingerprint WHERE db = ?", (self._db_key,)
+            ).fetchall())
+
+            profiled = []
+            for table, columns in schema.items():
+                fingerprint = table_fingerprint(conn, table)
+                if not force and known.get(table) == fingerprint:
+                    continue
+                profiles = [profile_column(conn, table, column) for column in columns]
+                with self._lock:
+                    self._store.execute("DELETE FROM column_profile WHERE db = ? AND tbl = ?", (self._db_key, table))
+                    self._store.executemany(
+                        "INSERT INTO column_profile VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(self._db_key, p.table, p.column, p.type, p.rows, p.nulls, p.distinct,
+                          json.dumps(p.min), json.dumps(p.max), json.dumps(p.top_values), i, time.time())
+                         for i, p in enumerate(profiles)],
+                    )
+                    self._store.execute("INSERT OR REPLACE INTO table_fingerprint VALUES (?, ?, ?)",
+                                        (self._db_key, table, fingerprint))
+                    self._store.commit()
+                profiled.append(table)
+
+            dropped = set(known) - set(schema)
+            with self._lock:
+                for table in dropped:
+                    self._store.execute("DELETE FROM column_profile WHERE db = ? AND tbl = ?", (self._db_key, table))
+                    self._store.execute("DELETE FROM table_fingerprint WHERE db = ? AND tbl = ?", (self._db_key, table))
+                self._store.commit()
+                if profiled or dropped:
+                    self._cache = None
+                self._version = version
+                self.stats["refreshes"] += 1
+                self.stats["tables_profiled"] += len(profiled)
+                self.stats["last_refresh_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            return profiled
+
+    def refresh_if_changed(self) -> List[str]:
+        """Refresh only when data_version or the file mtime moved since the last refresh."""
+        if self._refreshing.locked():
+            return []
+        if self._version is not None and self._current_version() == self._version:
+            return []
+        return self.refresh()
+
+    def refresh_in_background(self):
+        """Start refresh_if_changed on a daemon thread unless one is already running."""
+        if not self._refreshing.locked():
+            threading.Thread(target=self.refresh_if_changed, name="netflix-profile", daemon=True).start()
+
+    def profiles(self) -> Dict[str, List[ColumnProfile]]:
+        """Stored profiles by table, in column order. Never touches the source database."""
+        with self._lock:
+            if self._cache is None:
+                cache: Dict[str, List[ColumnProfile]] = {}
+                rows = self._store.execute(
+                    "SELECT tbl, col, type, rows, nulls, distinct_count, min_value, max_value, top_values"
+                    " FROM column_profile WHERE db = ? ORDER BY tbl, position", (self._db_key,)
+                ).fetchall()
+                for tbl, col, typ, nrows, nulls, distinct, lo, hi, top in rows:
+                    cache.setdefault(tbl, []).append(ColumnProfile(
+                        tbl, col, typ, nrows, nulls, distinct, json.loads(lo), json.loads(hi), json.loads(top)
+                    ))
+                self._cache = cache
+            return self._cache
+
+    def prompt_fragment(self, tables) -> str:
+        """Compact profile lines for the given tables; empty when none are profiled yet."""
+        profiles = self.profiles()
+        return "\n".join(p.describe() for table in tables for p in profiles.get(table, []))
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "netflixdb.sqlite"
+    store_path = sys.argv[2] if len(sys.argv) > 2 else str(Path(__file__).with_name("netflix_profile.sqlite"))
+    store = ColumnProfileStore(db_path, store_path)
+    tables = store.refresh()
+    print(f"Profiled {len(tables)} table(s) in {store.stats['last_refresh_ms']} ms: {', '.join(tables) or '-'}")
+    print(store.prompt_fragment(store.profiles()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import base64
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Hashable, List, Optional, Tuple
+
+FETCH_BATCH = 100
+
+# Output formats for query results. "auto" uses row objects for small pages and the
+# columnar form once repeating every column name on every row gets expensive.
+FORMATS = ("auto", "json", "columnar", "csv", "tsv", "summary")
+AUTO_COMPACT_ROWS = 20
+SUMMARY_SAMPLE_ROWS = 5
+
+
+@dataclass
+class Page:
+    columns: List[str]
+    rows: List[tuple]
+    offset: int
+    # Offset of the next page, or None when the result set is exhausted
+    next_offset: Optional[int]
+
+
+def fetch_page(conn: sqlite3.Connection, query: str, offset: int = 0, page_size: int = 100,
+               guard=None) -> Page:
+    """Run a query and return at most `page_size` rows starting at `offset`.
+
+    Rows are pulled with fetchmany, and the rows before `offset` are skipped
+    without being kept, so memory stays bounded by the page size no matter how
+    large the full result is. Only the rows of the page (plus the look-ahead
+    row) are reported to `guard.count_rows`; skipped rows are bounded by the
+    guard's time and VM-step limits, so a deep page token keeps working.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query)
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        skipped = 0
+        while skipped < offset:
+            batch = cursor.fetchmany(min(FETCH_BATCH, offset - skipped))
+            if not batch:
+                break
+            skipped += len(batch)
+
+        rows: List[tuple] = []
+        # Read one row past the page to learn whether another page exists
+        while len(rows) <= page_size:
+            batch = cursor.fetchmany(min(FETCH_BATCH, page_size + 1 - len(rows)))
+            if not batch:
+                break
+            rows.extend(batch)
+            if guard is not None:
+                guard.count_rows(len(batch))
+        has_more = len(rows) > page_size
+        return Page(columns, rows[:page_size], offset, offset + page_size if has_more else None)
+    finally:
+        cursor.close()
+
+
+def summarize_query(conn: sqlite3.Connection, query: str, sample_size: int = SUMMARY_SAMPLE_ROWS,
+                    guard=None) -> Tuple[List[str], List[tuple], int]:
+    """Count the rows of a query and keep only the first `sample_size` of them.
+
+    Returns (columns, sample rows, total row count). Only the kept sample rows
+    count against the guard's row limit; rows that are merely counted are
+    bounded by its time and VM-step limits instead.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query)
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        sample: List[tuple] = []
+        total = 0
+        while True:
+            batch = cursor.fetchmany(FETCH_BATCH)
+            if not batch:
+                break
+            if len(sample) < sample_size:
+                kept = batch[:sample_size - len(sample)]
+                sample.extend(kept)
+                if guard is not None:
+                    guard.count_rows(len(kept))
+            total += len(batch)
+        return columns, sample, total
+    finally:
+        cursor.close()
+
+
+def encode_page_token(query: str, offset: int, page_size: int, fmt: str = "auto") -> str:
+    """Opaque continuation token; the server keeps no cursor state between pages."""
+    payload = json.dumps({"q": query, "o": offset, "n": page_size, "f": fmt}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_page_token(token: str):
+    """Returns (query, offset, page_size, format). Raises ValueError for a malformed token."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return payload["q"], int(payload["o"]), int(payload["n"]), payload.get("f", "auto")
+    except Exception as e:
+        raise ValueError(f"Invalid page token: {e}") from e
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    return value
+
+
+def serialize_rows(columns: List[str], rows: List[tuple]) -> str:
+    """Serialize rows one at a time into a JSON array of objects."""
+    parts = ["["]
+    for i, row in enumerate(rows):
+        record = {col: _json_value(val) for col, val in zip(columns, row)}
+        parts.append(("\n  " if i == 0 else ",\n  ") + json.dumps(record))
+    parts.append("\n]" if rows else "]")
+    return "".join(parts)
+
+
+def serialize_columnar(columns: List[str], rows: List[tuple]) -> str:
+    """Column names once, then one compact array per row."""
+    parts = ['{"columns":', json.dumps(columns, separators=(",", ":")), ',"rows":[']
+    for i, row in enumerate(rows):
+        if i:
+            parts.append(",")
+        parts.append(json.dumps([_json_value(v) for v in row], separators=(",", ":")))
+    parts.append("]}")
+    return "".join(parts)
+
+
+def serialize_delimited(columns: List[str], rows: List[tuple], delimiter: str = ",") -> str:
+    out = io.StringIO()
+    writer = csv.writer(out, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(["" if v is None else _json_value(v) for v in row])
+    return out.getvalue().rstrip("\n")
+
+
+def serialize_summary(columns: List[str], sample: List[tuple], total: int) -> str:
+    return (f"{total} row(s), columns: {', '.join(columns)}\n"
+            f"First {len(sample)} row(s):\n{serialize_columnar(columns, sample)}")
+
+
+def encode_rows(columns: List[str], rows: List[tuple], fmt: str = "auto") -> str:
+    """Serialize a page of rows in the requested format (see FORMATS)."""
+    if fmt == "auto":
+        fmt = "json" if len(rows) <= AUTO_COMPACT_ROWS else "columnar"
+    if fmt == "json":
+        return serialize_rows(columns, rows)
+    if fmt == "columnar":
+        return serialize_columnar(columns, rows)
+    if fmt == "csv":
+        return serialize_delimited(columns, rows, ",")
+    if fmt == "tsv":
+        return serialize_delimited(columns, rows, "\t")
+    raise ValueError(f"Unknown output format '{fmt}', expected one of {', '.join(FORMATS)}")
+
+
+# String literals, quoted identifiers and comments, in the order SQLite's tokenizer would see them
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?\*/", re.S)
+_PUNCT_SPACE = re.compile(r"\s*([=<>!,()+\-*/;|%])\s*")
+
+
+def canonical_sql(query: str) -> str:
+    """Normalize SQL text for cache keys.
+
+    Comments are dropped, whitespace collapsed (and removed around operators and
+    punctuation), trailing semicolons stripped and everything outside string
+    literals and quoted identifiers lowercased, so statements that differ only
+    in formatting or keyword case share a key. The result is a key, not SQL to run.
+    """
+    out: List[str] = []
+    plain: List[str] = []
+
+    def flush():
+        text = " ".join("".join(plain).lower().split())
+        out.append(_PUNCT_SPACE.sub(r"\1", text))
+        plain.clear()
+
+    last = 0
+    for match in _SQL_TOKEN.finditer(query):
+        plain.append(query[last:match.start()])
+        token = match.group(0)
+        if token.startswith(("--", "/*")):
+            plain.append(" ")
+        else:
+            flush()
+            out.append(token)
+        last = match.end()
+    plain.append(query[last:])
+    flush()
+    return "".join(out).rstrip(";")
+
+
+class ResultCache:
+    """LRU cache of rendered query results, bounded by total size in bytes.
+
+    Every lookup compares the database file's mtime and PRAGMA data_version with
+    the values the entries were stored under, and drops everything when either
+    moved, so a write to the database is never answered from stale results.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _current_version(self) -> Tuple[int, int]:
+        if self._conn is None:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return os.stat(self.db_path).st_mtime_ns, self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_version(self):
+        version = self._current_version()
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self.size = 0
+            self._version = version
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            self._check_version()
+            value = self._entries.get(key)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: str):
+        cost = len(value.encode("utf-8"))
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version()
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.encode("utf-8"))
+            self._entries[key] = value
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.encode("utf-8"))
+                self.stats["evictions"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, entries=len(self._entries), bytes=self.size,
+                        hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else 0.0)
@@ -0,0 +1,145 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from netflix_db import SchemaSnapshot
+from netflix_sql_cache import STOPWORDS
+
+# Distinct text values sampled per column for the index
+SAMPLE_VALUES = 50
+# Term repetitions per field, so a hit on a table name outweighs a hit on a sampled value
+FIELD_WEIGHTS = {"table": 3, "column": 2, "value": 1}
+
+_CAMEL = re.compile(r"([a-z0-9])([A-Z])")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased word terms with snake_case/camelCase split and a naive plural strip."""
+    words = _WORD.findall(_CAMEL.sub(r"\1 \2", text).replace("_", " ").lower())
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+            for w in words if w not in STOPWORDS]
+
+
+def sample_values(conn: sqlite3.Connection, schema: Dict[str, List[str]],
+                  limit: int = SAMPLE_VALUES) -> Dict[str, List[str]]:
+    """Table -> a few distinct short text values from each of its columns."""
+    samples: Dict[str, List[str]] = {}
+    for table, columns in schema.items():
+        values: List[str] = []
+        for column in columns:
+            try:
+                rows = conn.execute(
+                    f'SELECT DISTINCT "{column}" FROM "{table}" WHERE typeof("{column}") = \'text\''
+                    f' AND length("{column}") <= 40 LIMIT {int(limit)}'
+                ).fetchall()
+            except sqlite3.Error:
+                continue
+            values.extend(row[0] for row in rows)
+        samples[table] = values
+    return samples
+
+
+@dataclass
+class SchemaSelection:
+    schema: Dict[str, List[str]]
+    prompt_json: str
+    # Relevance score per selected table; empty when the full schema was used
+    scores: Dict[str, float]
+    pruned: bool
+
+
+class SchemaIndex:
+    """BM25 index with one document per table: its name, column names and sampled values."""
+
+    def __init__(self, schema: Dict[str, List[str]], samples: Dict[str, List[str]],
+                 k1: float = 1.2, b: float = 0.75):
+        self.schema = schema
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Counter] = {}
+        for table, columns in schema.items():
+            doc: Counter = Counter()
+            for term in terms(table):
+                doc[term] += FIELD_WEIGHTS["table"]
+            for column in columns:
+                for term in terms(column):
+                    doc[term] += FIELD_WEIGHTS["column"]
+            for value in samples.get(table, []):
+                for term in terms(value):
+                    doc[term] += FIELD_WEIGHTS["value"]
+            self.docs[table] = doc
+        self.lengths = {t: sum(d.values()) for t, d in self.docs.items()}
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+        df: Counter = Counter()
+        for doc in self.docs.values():
+            df.update(doc.keys())
+        n = len(self.docs)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def scores(self, question: str) -> Dict[str, float]:
+        query = set(terms(question))
+        result = {}
+        for table, doc in self.docs.items():
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[table] / (self.avg_length or 1))
+            for term in query:
+                tf = doc.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                result[table] = score
+        return result
+
+    def select(self, question: str, top_k: int = 4, min_score: float = 1.0,
+               relative_cutoff: float = 0.25) -> SchemaSelection:
+        """Pick the top-k tables for a question, or the full schema when the match is weak.
+
+        Tables scoring below `relative_cutoff` of the best table are dropped. When
+        no table reaches `min_score`, or pruning would keep every table anyway,
+        the full schema is returned so Gemini is never denied a table it needs.
+        """
+        scores = self.scores(question)
+        ranked = sorted(scores.items(), key=lambda kv: -kv[1])
+        if not ranked or ranked[0][1] < min_score or len(self.schema) <= 1:
+            return SchemaSelection(self.schema, json.dumps(self.schema, indent=2), {}, False)
+        best = ranked[0][1]
+        chosen = [(t, s) for t, s in ranked[:top_k] if s >= best * relative_cutoff]
+        if len(chosen) == len(self.schema):
+            return SchemaSelection(self.schema, json.dumps(self.schema, indent=2), {}, False)
+        # Keep the catalog order so the prompt reads the same way the full schema does
+        pruned = {t: cols for t, cols in self.schema.items() if t in dict(chosen)}
+        return SchemaSelection(pruned, json.dumps(pruned, indent=2), {t: round(s, 3) for t, s in chosen}, True)
+
+
+class SchemaIndexCache:
+    """Rebuilds the SchemaIndex whenever the SchemaSnapshot it was built from changes."""
+
+    def __init__(self):
+        self._index: Optional[SchemaIndex] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self.stats = {"pruned": 0, "full": 0, "chars_saved": 0}
+
+    def get(self, conn: sqlite3.Connection, snapshot: SchemaSnapshot) -> SchemaIndex:
+        with self._lock:
+            if self._index is None or self._version != snapshot.version:
+                self._index = SchemaIndex(snapshot.schema, sample_values(conn, snapshot.schema))
+                self._version = snapshot.version
+            return self._index
+
+    def select(self, conn: sqlite3.Connection, snapshot: SchemaSnapshot, question: str,
+               top_k: int = 4) -> SchemaSelection:
+        selection = self.get(conn, snapshot).select(question, top_k)
+        with self._lock:
+            if selection.pruned:
+                self.stats["pruned"] += 1
+                self.stats["chars_saved"] += len(snapshot.prompt_json) - len(selection.prompt_json)
+            else:
+                self.stats["full"] += 1
+        return selection
@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from netflix_db import read_schema
+from netflix_profile import content_digest, table_fingerprint
+
+INSERT_BATCH = 1000
+# Text columns whose values look like these are not worth indexing
+_NOT_PROSE = re.compile(r"^(?:\d{4}-\d\d|[\d\s.,:-]+$)")
+_WORD = re.compile(r"\w+", re.U)
+
+
+@dataclass
+class SearchHit:
+    table: str
+    rowid: int
+    # bm25 rank; lower is more relevant
+    score: float
+    snippet: str
+
+
+def text_columns(conn: sqlite3.Connection, table: str, columns: List[str], sample: int = 200) -> List[str]:
+    """Columns that mostly hold free text, judged from a sample of their values."""
+    chosen = []
+    for column in columns:
+        lowered = column.lower()
+        if lowered == "id" or lowered.endswith("_id"):
+            continue
+        values = [v for v, in conn.execute(
+            f'SELECT "{column}" FROM "{table}" WHERE "{column}" IS NOT NULL LIMIT {int(sample)}'
+        )]
+        texts = [v for v in values if isinstance(v, str) and not _NOT_PROSE.match(v)]
+        if values and len(texts) >= len(values) * 0.8 and any(_WORD.search(v) for v in texts):
+            chosen.append(column)
+    return chosen
+
+
+def fts_query(text: str, any_term: bool = False) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: quoted terms, the last one as a prefix."""
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return (" OR " if any_term else " ").join(terms)
+
+
+class FullTextIndex:
+    """FTS5 index over the text columns of every table, kept in a side database.
+
+    Each source table gets an `fts_<table>` virtual table whose rowids are the
+    source rowids. A refresh runs when PRAGMA data_version or the file mtime
+    moves; tables that only gained rows past the last indexed rowid, with the
+    rows before it unchanged, are updated by inserting just those rows.
+    Anything else, including an UPDATE or DELETE, is rebuilt.
+    """
+
+    def __init__(self, db_path: str, index_path: str):
+        self.db_path = db_path
+        self._index = sqlite3.connect(index_path, check_same_thread=False)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS fts_meta ("
+            " tbl TEXT PRIMARY KEY, columns TEXT NOT NULL, fingerprint TEXT NOT NULL, last_rowid INTEGER)"
+        )
+        self._index.commit()
+        self._source: Optional[sqlite3.Connection] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self.stats = {"searches": 0, "refreshes": 0, "rows_indexed": 0, "rebuilds": 0, "last_search_ms": 0.0}
+
+    def _source_connection(self) -> sqlite3.Connection:
+        if self._source is None:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            self._source = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return self._source
+
+    def _current_version(self) -> Tuple[int, int]:
+        mtime = os.stat(self.db_path).st_mtime_ns
+        return mtime, self._source_connection().execute("PRAGMA data_version").fetchone()[0]
+
+    def _copy_rows(self, table: str, columns: List[str], after_rowid: Optional[int]) -> int:
+        cols = ", ".join(f'"{c}"' for c in columns)
+        where = f" WHERE rowid > {int(after_rowid)}" if after_rowid is not None else ""
+        cursor = self._source_connection().execute(f'SELECT rowid, {cols} FROM "{table}"{where} ORDER BY rowid')
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        copied = 0
+        while True:
+            batch = cursor.fetchmany(INSERT_BATCH)
+            if not batch:
+                return copied
+            self._index.executemany(f'INSERT INTO "fts_{table}" (rowid, {cols}) VALUES ({placeholders})', batch)
+            copied += len(batch)
+
+    def _refresh_table(self, table: str, columns: List[str], meta: Optional[tuple]):
+        conn = self._source_connection()
+        fingerprint = table_fingerprint(conn, table)
+        last_rowid = conn.execute(f'SELECT max(rowid) FROM "{table}"').fetchone()[0]
+        if meta is not None and json.loads(meta[0]) == columns:
+            if meta[1] == fingerprint:
+                return
+            old = meta[1].split(":")
+            new_count = int(fingerprint.split(":")[0])
+            appended = conn.execute(
+                f'SELECT count(*) FROM "{table}" WHERE rowid > ?', (meta[2] or 0,)
+            ).fetchone()[0]
+            if (meta[2] is not None and len(old) == 3 and appended == new_count - int(old[0])
+                    and content_digest(conn, table, meta[2]) == old[2]):
+                # Rows up to the last indexed rowid are untouched: index just the new ones
+                self.stats["rows_indexed"] += self._copy_rows(table, columns, meta[2])
+                self._save_meta(table, columns, fingerprint, last_rowid)
+                return
+
+        self._index.execute(f'DROP TABLE IF EXISTS "fts_{table}"')
+        cols = ", ".join(f'"{c}"' for c in columns)
+        self._index.execute(
+            f'CREATE VIRTUAL TABLE "fts_{table}" USING fts5({cols}, tokenize = \'unicode61 remove_diacritics 2\')'
+        )
+        self.stats["rows_indexed"] += self._copy_rows(table, columns, None)
+        self.stats["rebuilds"] += 1
+        self._save_meta(table, columns, fingerprint, last_rowid)
+
+    def _save_meta(self, table: str, columns: List[str], fingerprint: str, last_rowid: Optional[int]):
+        self._index.execute("INSERT OR REPLACE INTO fts_meta VALUES (?, ?, ?, ?)",
+                            (table, json.dumps(columns), fingerprint, last_rowid))
+        self._index.commit()
+
+    def refresh(self):
+        """Bring every table's index up to date with the source database."""
+        with self._lock:
+            conn = self._source_connection()
+            version = self._current_version()
+            schema = {t: cols for t, cols in read_schema(conn).items() if not t.startswith("sqlite_")}
+            known = {row[0]: row[1:] for row in self._index.execute("SELECT * FROM fts_meta").fetchall()}
+            for table, columns in schema.items():
+                try:
+                    indexed = text_columns(conn, table, columns)
+                    if indexed:
+                        self._refresh_table(table, indexed, known.get(table))
+                        continue
+                except sqlite3.OperationalError:
+                    # e.g. a WITHOUT ROWID table, which has no rowid to point back at
+                    pass
+                self._drop(table)
+            for table in set(known) - set(schema):
+                self._drop(table)
+            self._version = version
+            self.stats["refreshes"] += 1
+
+    def _drop(self, table: str):
+        self._index.execute(f'DROP TABLE IF EXISTS "fts_{table}"')
+        self._index.execute("DELETE FROM fts_meta WHERE tbl = ?", (table,))
+        self._index.commit()
+
+    def refresh_if_changed(self):
+        if self._version is None or self._current_version() != self._version:
+            self.refresh()
+
+    def tables(self) -> Dict[str, List[str]]:
+        """Indexed table -> indexed columns."""
+        with self._lock:
+            return {t: json.loads(c) for t, c in self._index.execute("SELECT tbl, columns FROM fts_meta")}
+
+    def search(self, text: str, limit: int = 10, table: Optional[str] = None) -> List[SearchHit]:
+        """Ranked matches across the indexed tables; all terms must match, else any term."""
+        self.refresh_if_changed()
+        started = time.perf_counter()
+        tables = [t for t in self.tables() if table is None or t == table]
+        hits: List[SearchHit] = []
+        for any_term in (False, True):
+            query = fts_query(text, any_term)
+            if query is None:
+                break
+            with self._lock:
+                for name in tables:
+                    rows = self._index.execute(
+                        f'SELECT rowid, bm25("fts_{name}"), snippet("fts_{name}", -1, \'[\', \']\', \'...\', 12)'
+                        f' FROM "fts_{name}" WHERE "fts_{name}" MATCH ? ORDER BY bm25("fts_{name}") LIMIT ?',
+                        (query, limit),
+                    ).fetchall()
+                    hits.extend(SearchHit(name, rowid, score, snippet) for rowid, score, snippet in rows)
+            if hits:
+                break
+        hits.sort(key=lambda h: h.score)
+        self.stats["searches"] += 1
+        self.stats["last_search_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return hits[:limit]
+
+
+def hit_records(conn: sqlite3.Connection, hits: List[SearchHit]) -> List[dict]:
+    """Hits joined back to their source rows, in rank order."""
+    rows: Dict[Tuple[str, int], dict] = {}
+    by_table: Dict[str, List[int]] = {}
+    for hit in hits:
+        by_table.setdefault(hit.table, []).append(hit.rowid)
+    for table, rowids in by_table.items():
+        cursor = conn.execute(
+            f'SELECT rowid, * FROM "{table}" WHERE rowid IN ({", ".join("?" * len(rowids))})', rowids
+        )
+        columns = [d[0] for d in cursor.description][1:]
+        for rowid, *values in cursor:
+            rows[(table, rowid)] = dict(zip(columns, values))
+    return [dict({"table": h.table, "score": round(-h.score, 3), "match": h.snippet}, **rows.get((h.table, h.rowid), {}))
+            for h in hits]
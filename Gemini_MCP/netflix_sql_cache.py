@@ -0,0 +1,125 @@
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Words that do not change which SQL a question maps to
+STOPWORDS = frozenset("""
+a an the of in on for to by with and or is are was were be me my i we you show list give
+find get tell what which who whose how please all from that this those these there their
+""".split())
+
+# Stopwords that still decide which SQL a question maps to ("India or Japan", "by",
+# "with", "from"), so the near-duplicate key keeps them
+CONNECTIVES = frozenset("and or not in on for to by with from".split())
+FILLER = STOPWORDS - CONNECTIVES
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_WORD.findall(question.lower()))
+
+
+# Words that mean the same thing in a question about this database
+SYNONYMS = {
+    "film": "movie", "films": "movie", "movies": "movie",
+    "shows": "show", "series": "show",
+    "titles": "title",
+    "genres": "genre", "category": "genre", "categories": "genre",
+    "directors": "director", "actors": "actor", "cast": "actor",
+    "countries": "country", "years": "year", "ratings": "rating",
+    "number": "count", "many": "count",
+}
+
+
+def question_tokens(question: str) -> Tuple[str, ...]:
+    """The words of a question in order, minus filler, with synonyms folded together.
+
+    Connectives, prepositions, negations, comparatives and values are all kept,
+    and so is word order, so "directors by number of movies" and "movies by
+    number of directors" get different tokens.
+    """
+    return tuple(SYNONYMS.get(w, w) for w in _WORD.findall(question.lower()) if w not in FILLER)
+
+
+class SQLTranslationCache:
+    """Persistent cache from (normalized question, schema hash) to generated SQL.
+
+    Exact matches are looked up by key. With `near_duplicates` enabled, a miss
+    falls back to an earlier question for the same schema that has the same
+    words in the same order once filler words are dropped and known synonyms
+    folded (see question_tokens). Any other difference, such as "not", "or",
+    "after", "descending", a value or a swapped pair of words, rules the match out.
+    """
+
+    def __init__(self, path: str, near_duplicates: bool = False):
+        self.near_duplicates = near_duplicates
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS nl2sql ("
+            " question TEXT NOT NULL, schema_hash TEXT NOT NULL, sql TEXT NOT NULL,"
+            " created REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (question, schema_hash))"
+        )
+        self._conn.commit()
+        # schema hash -> {question tokens: (normalized question, sql)} for near-duplicate lookup
+        self._index: Dict[str, Dict[Tuple[str, ...], Tuple[str, str]]] = {}
+
+    def _candidates(self, schema_hash: str) -> Dict[Tuple[str, ...], Tuple[str, str]]:
+        if schema_hash not in self._index:
+            rows = self._conn.execute(
+                "SELECT question, sql FROM nl2sql WHERE schema_hash = ?", (schema_hash,)
+            ).fetchall()
+            self._index[schema_hash] = {question_tokens(q): (q, sql) for q, sql in rows}
+        return self._index[schema_hash]
+
+    def lookup(self, question: str, schema_hash: str) -> Optional[str]:
+        """Return cached SQL for the question, or None on a miss."""
+        normalized = normalize_question(question)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql FROM nl2sql WHERE question = ? AND schema_hash = ?", (normalized, schema_hash)
+            ).fetchone()
+            if row is not None:
+                self.stats["hits"] += 1
+                self._bump(normalized, schema_hash)
+                return row[0]
+
+            if self.near_duplicates:
+                tokens = question_tokens(question)
+                match = self._candidates(schema_hash).get(tokens) if tokens else None
+                if match is not None:
+                    self.stats["near_hits"] += 1
+                    self._bump(match[0], schema_hash)
+                    return match[1]
+
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, question: str, schema_hash: str, sql: str):
+        normalized = normalize_question(question)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO nl2sql (question, schema_hash, sql, created) VALUES (?, ?, ?, ?)",
+                (normalized, schema_hash, sql, time.time()),
+            )
+            self._conn.commit()
+            if schema_hash in self._index:
+                self._index[schema_hash][question_tokens(question)] = (normalized, sql)
+            self.stats["stores"] += 1
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["near_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["near_hits"]) / lookups if lookups else 0.0
+
+    def _bump(self, normalized: str, schema_hash: str):
+        self._conn.execute(
+            "UPDATE nl2sql SET hits = hits + 1 WHERE question = ? AND schema_hash = ?", (normalized, schema_hash)
+        )
+        self._conn.commit()
@@ -0,0 +1,196 @@
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from netflix_profile import ColumnProfile
+from netflix_sql_cache import normalize_question
+
+# Column names that can play each role, in order of preference
+ROLES = {
+    "title": ["title", "name"],
+    "type": ["type", "kind", "show_type"],
+    "rating": ["rating", "imdb_score", "imdb_rating", "score", "vote_average"],
+    "runtime": ["runtime", "duration"],
+    "views": ["views", "hours_viewed"],
+    "year": ["release_year", "year"],
+    "date": ["release_date", "date_added", "premiere_date"],
+    "genre": ["listed_in", "genre", "genres"],
+    "country": ["country", "countries"],
+    "director": ["director"],
+    "language": ["language", "original_language", "locale"],
+}
+
+# Words in a question -> the role they refer to
+METRICS = {
+    "rating": "rating", "ratings": "rating", "score": "rating", "imdb score": "rating", "imdb rating": "rating",
+    "runtime": "runtime", "duration": "runtime", "length": "runtime",
+    "views": "views", "view": "views", "viewership": "views", "hours viewed": "views",
+    "year": "year", "release year": "year",
+}
+DIMENSIONS = {
+    "genre": "genre", "genres": "genre", "category": "genre", "categories": "genre",
+    "country": "country", "countries": "country",
+    "year": "year", "release year": "year",
+    "director": "director", "directors": "director",
+    "language": "language", "languages": "language", "locale": "language",
+    "rating": "rating", "ratings": "rating",
+    "type": "type",
+}
+
+KINDS = {"movie": "movie", "movies": "movie", "film": "movie", "films": "movie", "show": "show",
+         "shows": "show", "series": "show", "title": "any", "titles": "any"}
+_KIND = r"(?P<kind>movies?|films?|tv shows?|shows?|series|titles?)"
+_LEAD = r"(?:(?:show|list|give|get|find|tell|what|which|are|is|me|the|all|of|please)\s+)*"
+PATTERNS = [
+    ("top_by", re.compile(
+        _LEAD + r"(?:top|best|highest)\s+(?P<n>\d+)\s+" + _KIND +
+        r"\s+(?:by|ranked by|sorted by|with (?:the )?(?:highest|most|best))\s+(?P<metric>[a-z ]+)$")),
+    ("count_by", re.compile(
+        _LEAD + r"(?:count|number of|how many)\s+" + _KIND +
+        r"\s+(?:by|per|for each|in each|grouped by)\s+(?P<dim>[a-z ]+)$")),
+    ("released_in", re.compile(
+        _LEAD + _KIND + r"\s+(?:released|from|that came out|came out)\s+(?:in\s+)?(?P<year>(?:19|20)\d\d)$")),
+    ("count", re.compile(
+        _LEAD + r"(?:how many|number of|count(?: of)?|count all)\s+" + _KIND + r"(?:\s+are there)?$")),
+]
+
+_NUMERIC = ("integer", "real")
+_ISO_DATE = re.compile(r"^\d{4}-\d\d")
+
+
+# Roles that are often stored as comma-separated lists, e.g. listed_in = "Dramas, Thrillers"
+_LIST_ROLES = ("genre", "country")
+
+
+def _multi_valued(profile: ColumnProfile, role_name: str) -> bool:
+    """True when grouping on the column could count value combinations rather than values.
+
+    That is any column whose profiled values contain ", ", and any text column
+    for a list-prone role with too many distinct values to have top values.
+    """
+    values = list(profile.top_values) + [profile.min, profile.max]
+    if any(isinstance(v, str) and ", " in v for v in values):
+        return True
+    return role_name in _LIST_ROLES and profile.type == "text" and not profile.top_values
+
+
+@dataclass
+class TemplateMatch:
+    template: str
+    sql: str
+
+
+class TemplateMatcher:
+    """Maps common question shapes straight to SQL, so they skip the Gemini round trip.
+
+    A template only fires when the whole question matches its pattern and every
+    table, column and literal it needs is found in the cached schema and column
+    profiles (numeric metrics must be numeric, type filters must use a value
+    that actually occurs). Anything less confident falls through to Gemini.
+    """
+
+    def __init__(self):
+        self.stats = {"fast_path": 0, "fallthrough": 0}
+        self._lock = threading.Lock()
+
+    def match(self, question: str, schema: Dict[str, List[str]],
+              profiles: Dict[str, List[ColumnProfile]]) -> Optional[TemplateMatch]:
+        text = normalize_question(question)
+        result = None
+        for name, pattern in PATTERNS:
+            m = pattern.match(text)
+            if m:
+                result = self._build(name, m.groupdict(), schema, profiles)
+                break
+        with self._lock:
+            self.stats["fast_path" if result else "fallthrough"] += 1
+        return result
+
+    def _build(self, name: str, groups: Dict[str, str], schema: Dict[str, List[str]],
+               profiles: Dict[str, List[ColumnProfile]]) -> Optional[TemplateMatch]:
+        target = self._resolve_kind(groups["kind"], schema, profiles)
+        if target is None:
+            return None
+        table, where = target
+        columns = {p.column: p for p in profiles.get(table, [])}
+
+        def role(role_name: str, numeric: bool = False) -> Optional[ColumnProfile]:
+            for candidate in ROLES[role_name]:
+                if candidate in columns and (not numeric or columns[candidate].type in _NUMERIC):
+                    return columns[candidate]
+            return None
+
+        filters = [where] if where else []
+        if name == "count":
+            sql = f'SELECT COUNT(*) AS count FROM "{table}"'
+        elif name == "top_by":
+            metric = METRICS.get(groups["metric"].strip())
+            title, col = role("title"), metric and role(metric, numeric=True)
+            if not title or not col:
+                return None
+            filters.append(f'"{col.column}" IS NOT NULL')
+            sql = (f'SELECT "{title.column}", "{col.column}" FROM "{table}" WHERE {" AND ".join(filters)}'
+                   f' ORDER BY "{col.column}" DESC LIMIT {int(groups["n"])}')
+            return TemplateMatch(name, sql)
+        elif name == "count_by":
+            dim = DIMENSIONS.get(groups["dim"].strip())
+            col = dim and role(dim)
+            expr = col and f'"{col.column}"'
+            if not col and dim == "year":
+                col = role("date")
+                if col is None or not isinstance(col.min, str) or not _ISO_DATE.match(col.min):
+                    return None
+                expr = f'substr("{col.column}", 1, 4)'
+            if not col or _multi_valued(col, dim):
+                return None
+            alias = groups["dim"].strip().replace(" ", "_")
+            sql = f'SELECT {expr} AS "{alias}", COUNT(*) AS count FROM "{table}"'
+            if filters:
+                sql += f' WHERE {" AND ".join(filters)}'
+            return TemplateMatch(name, sql + " GROUP BY 1 ORDER BY count DESC")
+        elif name == "released_in":
+            title, year, date = role("title"), role("year", numeric=True), role("date")
+            if not title:
+                return None
+            if year is not None:
+                filters.append(f'"{year.column}" = {int(groups["year"])}')
+                extra = year.column
+            elif date is not None and isinstance(date.min, str) and _ISO_DATE.match(date.min):
+                filters.append(f"substr(\"{date.column}\", 1, 4) = '{int(groups['year'])}'")
+                extra = date.column
+            else:
+                return None
+            sql = f'SELECT "{title.column}", "{extra}" FROM "{table}" WHERE {" AND ".join(filters)} ORDER BY "{title.column}"'
+            return TemplateMatch(name, sql)
+        else:
+            return None
+        if filters:
+            sql += f' WHERE {" AND ".join(filters)}'
+        return TemplateMatch(name, sql)
+
+    def _resolve_kind(self, kind: str, schema: Dict[str, List[str]],
+                      profiles: Dict[str, List[ColumnProfile]]) -> Optional[Tuple[str, Optional[str]]]:
+        """(table, optional WHERE filter) holding the kind of title asked about."""
+        wanted = KINDS[kind.split()[-1]]
+        titled = [t for t, cols in schema.items() if any(c in cols for c in ROLES["title"]) and t in profiles]
+
+        if wanted == "any":
+            return (titled[0], None) if len(titled) == 1 else None
+
+        names = {"movie": {"movie", "movies", "film", "films"},
+                 "show": {"tv_show", "tv_shows", "show", "shows", "series", "tv_series"}}[wanted]
+        dedicated = [t for t in titled if t.lower() in names]
+        if len(dedicated) == 1:
+            return dedicated[0], None
+
+        # A single table of all titles with a type column, e.g. type = 'Movie' / 'TV Show'
+        value = re.compile(r"movie|film" if wanted == "movie" else r"tv|show|series", re.I)
+        for table in titled:
+            for profile in profiles[table]:
+                if profile.column in ROLES["type"] and profile.type == "text":
+                    hits = [v for v in profile.top_values if isinstance(v, str) and value.search(v)]
+                    if len(hits) == 1:
+                        literal = hits[0].replace("'", "''")
+                        return table, f"\"{profile.column}\" = '{literal}'"
+        return None
@@ -0,0 +1,39 @@
+import sqlite3
+
+from netflix_advisor import IndexAdvisor
+from netflix_db import read_schema
+
+
+def test_prefix_shapes_fold_into_one_proposal(tmp_path):
+    path = str(tmp_path / "titles.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE titles (title TEXT, country TEXT, release_year INTEGER, director TEXT, type TEXT)")
+    conn.executemany("INSERT INTO titles VALUES (?, ?, ?, ?, ?)", [
+        (f"t{i}", f"c{i % 40}", 1990 + i % 30, f"d{i % 300}", "Movie" if i % 3 else "TV Show") for i in range(5000)
+    ])
+    conn.commit()
+    schema = read_schema(conn)
+
+    # Half the workload filters on country, split over three shapes; the rest are one-off director shapes
+    workload = [
+        "SELECT title FROM titles WHERE country = 'c1'",
+        "SELECT title FROM titles WHERE country = 'c2' AND release_year = 2001",
+        "SELECT title FROM titles WHERE country = 'c3' AND type = 'Movie'",
+        "SELECT title FROM titles WHERE country = 'c4'",
+        "SELECT title FROM titles WHERE country = 'c5' AND release_year = 2005",
+        "SELECT title FROM titles WHERE country = 'c6' AND type = 'TV Show'",
+        "SELECT title FROM titles WHERE director = 'd1'",
+        "SELECT title FROM titles WHERE director = 'd2' AND type = 'Movie'",
+        "SELECT title FROM titles WHERE director = 'd3' AND release_year = 2010",
+        "SELECT title FROM titles WHERE director = 'd4' ORDER BY release_year",
+        "SELECT title FROM titles WHERE type = 'Movie' AND director = 'd5' AND release_year > 2000",
+        "SELECT count(*) FROM titles WHERE release_year < 1995 AND director = 'd6'",
+    ]
+    advisor = IndexAdvisor(path, large_table_rows=1000)
+    for sql in workload:
+        advisor.record(conn, sql, 1.0, schema)
+
+    proposals = advisor.proposals(conn, per_table=1)
+    assert [p.columns[0] for p in proposals] == ["country"]
+    assert "country (eq x6)" in proposals[0].reason
+    assert "SELECT title FROM titles WHERE country = 'c4'" in proposals[0].sample_queries
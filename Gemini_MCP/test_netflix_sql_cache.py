@@ -0,0 +1,34 @@
+from netflix_sql_cache import SQLTranslationCache
+
+
+def near_hit(stored: str, asked: str) -> bool:
+    cache = SQLTranslationCache(":memory:", near_duplicates=True)
+    cache.store(stored, "schema", "SELECT 1")
+    return cache.lookup(asked, "schema") is not None
+
+
+def test_near_duplicates_are_off_by_default():
+    cache = SQLTranslationCache(":memory:")
+    cache.store("movies from India", "schema", "SELECT 1")
+    assert cache.lookup("Show me the films from India", "schema") is None
+
+
+def test_filler_and_synonyms_still_match():
+    assert near_hit("movies directed by Martin Scorsese after 2000",
+                    "Show me the films directed by Martin Scorsese after 2000")
+
+
+def test_connectives_are_content():
+    assert not near_hit("movies from India or Japan", "movies from India and Japan")
+
+
+def test_word_order_matters():
+    assert not near_hit("top 5 directors by number of movies", "top 5 movies by number of directors")
+    assert not near_hit("countries with the most shows", "shows with the most countries")
+
+
+def test_negations_comparatives_and_values_never_match():
+    stored = "movies directed by Martin Scorsese released after 2000"
+    assert not near_hit(stored, "movies not directed by Martin Scorsese released after 2000")
+    assert not near_hit(stored, "movies directed by Martin Scorsese released before 2000")
+    assert not near_hit(stored, "movies directed by Martin Scorsese released after 2001")
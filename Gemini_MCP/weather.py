@@ -1,27 +1,372 @@
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from pathlib import Path
 from typing import Any
+from urllib.parse import urlsplit
 import httpx
 from mcp.server.fastmcp import FastMCP
 
-# Initialize FastMCP server
-mcp = FastMCP("weather")
-
 # Constants
-NWS_API_BASE = "https://api.weather.gov"
+NWS_API_BASE = os.getenv("NWS_API_BASE", "https://api.weather.gov")
 USER_AGENT = "weather-app/1.0"
+# Connection pool of the shared client
+NWS_MAX_CONNECTIONS = int(os.getenv("NWS_MAX_CONNECTIONS", "20"))
+NWS_MAX_KEEPALIVE = int(os.getenv("NWS_MAX_KEEPALIVE", "10"))
+NWS_KEEPALIVE_EXPIRY = float(os.getenv("NWS_KEEPALIVE_EXPIRY", "30"))
+# Requests in flight per upstream host
+NWS_MAX_PER_HOST = int(os.getenv("NWS_MAX_PER_HOST", "10"))
+# HTTP/2 needs the h2 package (pip install "httpx[http2]"); without it the client stays on HTTP/1.1
+NWS_HTTP2 = os.getenv("NWS_HTTP2", "1") != "0"
 
-async def make_nws_request(url: str) -> dict[str, Any] | None:
-    """Make a request to the NWS API with proper error handling."""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json"
-    }
-    async with httpx.AsyncClient() as client:
+# /points lookups: coordinates are rounded to this many decimals (2 is about 1 km) before caching
+NWS_GRID_PRECISION = int(os.getenv("NWS_GRID_PRECISION", "2"))
+NWS_GRID_CACHE_PATH = os.getenv("NWS_GRID_CACHE_PATH", str(Path(__file__).with_name("nws_gridpoints.json")))
+NWS_GRID_TTL = float(os.getenv("NWS_GRID_TTL", str(30 * 24 * 3600)))
+
+# Parsed responses kept by the HTTP cache under make_nws_request
+NWS_HTTP_CACHE_ENTRIES = int(os.getenv("NWS_HTTP_CACHE_ENTRIES", "256"))
+# Stale-while-revalidate: how long past expiry a cached response may still be served
+# while it is refreshed in the background
+NWS_STALE_GRACE = float(os.getenv("NWS_STALE_GRACE", "300"))
+# Background refresher: how often it runs, how many of the most requested URLs it keeps
+# warm, the half-life (seconds) of the request counts that rank them, and the decayed
+# count a URL needs to be kept warm at all
+NWS_REFRESH_INTERVAL = float(os.getenv("NWS_REFRESH_INTERVAL", "15"))
+NWS_HOT_KEYS = int(os.getenv("NWS_HOT_KEYS", "10"))
+NWS_HOT_HALF_LIFE = float(os.getenv("NWS_HOT_HALF_LIFE", "600"))
+NWS_HOT_MIN_SCORE = float(os.getenv("NWS_HOT_MIN_SCORE", "1.5"))
+
+_client: httpx.AsyncClient | None = None
+_host_limits: dict[str, asyncio.Semaphore] = {}
+
+def new_client(**overrides: Any) -> httpx.AsyncClient:
+    """An AsyncClient with the server's pool, keep-alive and protocol settings."""
+    http2 = NWS_HTTP2 and importlib.util.find_spec("h2") is not None
+    options: dict[str, Any] = dict(
+        headers={"User-Agent": USER_AGENT, "Accept": "application/geo+json"},
+        timeout=httpx.Timeout(30.0, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=NWS_MAX_CONNECTIONS,
+            max_keepalive_connections=NWS_MAX_KEEPALIVE,
+            keepalive_expiry=NWS_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+    options.update(overrides)
+    return httpx.AsyncClient(**options)
+
+def get_client() -> httpx.AsyncClient:
+    """The server-lifetime client, so every request reuses pooled keep-alive connections."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = new_client()
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(NWS_MAX_PER_HOST)
+    return _host_limits[host]
+
+class GridpointCache:
+    """Rounded lat/lon -> forecast URL, in memory and persisted to a JSON file.
+
+    A point's NWS grid cell practically never changes, so a hit saves the
+    /points round trip on every repeated or nearby forecast request.
+    """
+
+    def __init__(self, path: str, precision: int = 2, ttl: float = 30 * 24 * 3600):
+        self.path = path
+        self.precision = precision
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries: dict[str, dict[str, Any]] = {}
         try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception:
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def key(self, latitude: float, longitude: float) -> str:
+        return f"{round(latitude, self.precision):.{self.precision}f},{round(longitude, self.precision):.{self.precision}f}"
+
+    def get(self, latitude: float, longitude: float) -> str | None:
+        entry = self._entries.get(self.key(latitude, longitude))
+        if entry is None or time.time() - entry["stored"] > self.ttl:
+            self.stats["misses"] += 1
             return None
+        self.stats["hits"] += 1
+        return entry["forecast"]
+
+    def set(self, latitude: float, longitude: float, forecast_url: str):
+        self._entries[self.key(latitude, longitude)] = {"forecast": forecast_url, "stored": time.time()}
+        self._save()
+
+    def discard(self, latitude: float, longitude: float):
+        if self._entries.pop(self.key(latitude, longitude), None) is not None:
+            self._save()
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save gridpoint cache: {e}", file=sys.stderr)
+
+gridpoints = GridpointCache(NWS_GRID_CACHE_PATH, NWS_GRID_PRECISION, NWS_GRID_TTL)
+
+@dataclass
+class CachedResponse:
+    data: dict[str, Any]
+    etag: str | None
+    last_modified: str | None
+    # time.time() until which the entry can be served without asking upstream
+    fresh_until: float
+    # Whether it may be served stale while a background refresh runs
+    allow_stale: bool = False
+
+def cache_directives(headers: httpx.Headers) -> dict[str, str]:
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+def allows_stale(headers: httpx.Headers) -> bool:
+    """Only responses given a positive lifetime and no revalidation demand are served stale."""
+    directives = cache_directives(headers)
+    if directives.keys() & {"no-cache", "no-store", "must-revalidate", "proxy-revalidate"}:
+        return False
+    return bool(freshness(headers))
+
+def freshness(headers: httpx.Headers) -> float | None:
+    """Seconds a response stays fresh per Cache-Control/Expires, or None if it must not be stored."""
+    directives = cache_directives(headers)
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    age = headers.get("Age", "")
+    age = float(age) if age.isdigit() else 0.0
+    if "max-age" in directives:
+        try:
+            return max(0.0, float(directives["max-age"]) - age)
+        except ValueError:
+            return 0.0
+    if "Expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            date = parsedate_to_datetime(headers["Date"]).timestamp() if "Date" in headers else time.time()
+            return max(0.0, expires - date)
+        except (TypeError, ValueError):
+            return 0.0
+    # No freshness information: keep it, but revalidate before every reuse
+    return 0.0
+
+class HTTPCache:
+    """LRU cache of parsed NWS responses that follows the response caching headers.
+
+    Fresh entries (max-age / Expires) are served without a request. Stale entries
+    are revalidated with If-None-Match / If-Modified-Since, and a 304 reuses the
+    stored body. no-store responses are never kept.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "stale_served": 0, "revalidated": 0, "misses": 0, "evictions": 0,
+                      "background_refreshes": 0}
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+
+    def get(self, url: str) -> CachedResponse | None:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def store(self, url: str, response: httpx.Response, data: dict[str, Any]):
+        ttl = freshness(response.headers)
+        if ttl is None or self.max_entries <= 0:
+            self._entries.pop(url, None)
+            return
+        self._entries[url] = CachedResponse(
+            data, response.headers.get("ETag"), response.headers.get("Last-Modified"), time.time() + ttl,
+            allows_stale(response.headers),
+        )
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def refresh(self, url: str, entry: CachedResponse, response: httpx.Response) -> CachedResponse:
+        """Apply the headers of a 304 to a stored entry (re-adding it if it was evicted meanwhile)."""
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        ttl = freshness(response.headers)
+        entry.fresh_until = time.time() + (ttl or 0.0)
+        entry.etag = response.headers.get("ETag", entry.etag)
+        entry.last_modified = response.headers.get("Last-Modified", entry.last_modified)
+        if "Cache-Control" in response.headers or "Expires" in response.headers:
+            entry.allow_stale = allows_stale(response.headers)
+        return entry
+
+http_cache = HTTPCache(NWS_HTTP_CACHE_ENTRIES)
+
+class RequestHeat:
+    """Exponentially decaying request counts per URL, to find the hot keys.
+
+    URLs whose decayed count falls below `min_score` are not hot, and are forgotten.
+    """
+
+    def __init__(self, half_life: float = 600.0, max_keys: int = 1024, min_score: float = 1.5):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self.min_score = min_score
+        self._scores: dict[str, tuple[float, float]] = {}
+
+    def _decayed(self, url: str, now: float) -> float:
+        score, last = self._scores.get(url, (0.0, now))
+        return score * 0.5 ** ((now - last) / self.half_life)
+
+    def record(self, url: str):
+        now = time.time()
+        self._scores[url] = (self._decayed(url, now) + 1.0, now)
+        if len(self._scores) > self.max_keys:
+            # Forget the coldest half
+            ranked = sorted(self._scores, key=lambda u: self._decayed(u, now))
+            for cold in ranked[:len(ranked) // 2]:
+                del self._scores[cold]
+
+    def hottest(self, n: int) -> list[str]:
+        now = time.time()
+        scores = {u: self._decayed(u, now) for u in self._scores}
+        for cold in [u for u, score in scores.items() if score < self.min_score]:
+            # A URL that was requested once, or not for a while, is not worth refreshing
+            del self._scores[cold]
+        return sorted(self._scores, key=scores.get, reverse=True)[:n]
+
+request_heat = RequestHeat(NWS_HOT_HALF_LIFE, min_score=NWS_HOT_MIN_SCORE)
+# URL -> the upstream request in flight for it; concurrent callers share it (single-flight)
+_inflight: dict[str, asyncio.Task] = {}
+single_flight_stats = {"upstream_requests": 0, "coalesced": 0}
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    refresher = asyncio.create_task(refresh_hot_keys())
+    try:
+        yield
+    finally:
+        refresher.cancel()
+        for task in list(_inflight.values()):
+            task.cancel()
+        await asyncio.gather(refresher, *_inflight.values(), return_exceptions=True)
+        # Close pooled connections cleanly when the server shuts down
+        await close_client()
+
+# Initialize FastMCP server
+mcp = FastMCP("weather", lifespan=lifespan)
+
+async def fetch_nws(url: str, cached: CachedResponse | None, background: bool = False) -> dict[str, Any] | None:
+    """GET a URL, revalidating `cached` if given, and update the HTTP cache.
+
+    Background refreshes are counted separately, not as revalidations or misses.
+    """
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    try:
+        async with _host_limit(url):
+            response = await get_client().get(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            if not background:
+                http_cache.stats["revalidated"] += 1
+            return http_cache.refresh(url, cached, response).data
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        print(f"NWS request failed for {url}: {e}", file=sys.stderr)
+        return None
+    if not background:
+        http_cache.stats["misses"] += 1
+    http_cache.store(url, response, data)
+    return data
+
+def _start_fetch(url: str, cached: CachedResponse | None, background: bool = False) -> asyncio.Task:
+    task = asyncio.create_task(fetch_nws(url, cached, background))
+    _inflight[url] = task
+    single_flight_stats["upstream_requests"] += 1
+
+    def done(finished: asyncio.Task):
+        if _inflight.get(url) is finished:
+            del _inflight[url]
+
+    task.add_done_callback(done)
+    return task
+
+async def fetch_coalesced(url: str, cached: CachedResponse | None) -> dict[str, Any] | None:
+    """fetch_nws, but callers asking for a URL that is already in flight wait for that request."""
+    task = _inflight.get(url)
+    if task is None:
+        task = _start_fetch(url, cached)
+    else:
+        single_flight_stats["coalesced"] += 1
+    # A caller that gets cancelled must not cancel the request the others are waiting on
+    return await asyncio.shield(task)
+
+def refresh_in_background(url: str):
+    """Revalidate a cached URL without making anyone wait for it."""
+    if url in _inflight:
+        return
+    _start_fetch(url, http_cache.get(url), background=True)
+    http_cache.stats["background_refreshes"] += 1
+
+async def refresh_hot_keys():
+    """Periodically refresh the most requested URLs shortly before their cached copy expires."""
+    while True:
+        await asyncio.sleep(NWS_REFRESH_INTERVAL)
+        horizon = time.time() + NWS_REFRESH_INTERVAL
+        for url in request_heat.hottest(NWS_HOT_KEYS):
+            cached = http_cache.get(url)
+            if cached is not None and cached.allow_stale and cached.fresh_until <= horizon:
+                refresh_in_background(url)
+
+async def make_nws_request(url: str) -> dict[str, Any] | None:
+    """Make a request to the NWS API with proper error handling."""
+    request_heat.record(url)
+    cached = http_cache.get(url)
+    if cached is not None:
+        now = time.time()
+        if now < cached.fresh_until:
+            http_cache.stats["hits"] += 1
+            return cached.data
+        if cached.allow_stale and now < cached.fresh_until + NWS_STALE_GRACE:
+            # Serve the slightly stale copy now and revalidate behind it
+            http_cache.stats["stale_served"] += 1
+            refresh_in_background(url)
+            return cached.data
+    return await fetch_coalesced(url, cached)
 
 def format_alert(feature: dict) -> str:
     """Format an alert feature into a readable string."""
@@ -61,16 +406,24 @@ async def get_forecast(latitude: float, longitude: float) -> str:
         latitude: Latitude of the location
         longitude: Longitude of the location
     """
-    # First get the forecast grid endpoint
-    points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
+    # The forecast URL for this grid cell is usually cached; otherwise ask /points for it
+    forecast_url = gridpoints.get(latitude, longitude)
+    forecast_data = await make_nws_request(forecast_url) if forecast_url else None
+    if forecast_url and not forecast_data:
+        # The cached grid may have been reassigned; look it up again
+        gridpoints.discard(latitude, longitude)
 
-    if not points_data:
-        return "Unable to fetch forecast data for this location."
+    if not forecast_data:
+        points_url = f"{NWS_API_BASE}/points/{latitude},{longitude}"
+        points_data = await make_nws_request(points_url)
 
-    # Get the forecast URL from the points response
-    forecast_url = points_data["properties"]["forecast"]
-    forecast_data = await make_nws_request(forecast_url)
+        if not points_data:
+            return "Unable to fetch forecast data for this location."
+
+        # Get the forecast URL from the points response
+        forecast_url = points_data["properties"]["forecast"]
+        gridpoints.set(latitude, longitude, forecast_url)
+        forecast_data = await make_nws_request(forecast_url)
 
     if not forecast_data:
         return "Unable to fetch detailed forecast."
@@ -89,6 +442,15 @@ Forecast: {period['detailedForecast']}
 
     return "\n---\n".join(forecasts)
 
+@mcp.tool()
+async def cache_stats() -> str:
+    """Hit, revalidation and miss counts of the weather server's caches."""
+    return json.dumps({
+        "http": dict(http_cache.stats, entries=len(http_cache)),
+        "single_flight": dict(single_flight_stats, in_flight=len(_inflight)),
+        "gridpoints": dict(gridpoints.stats),
+    }, indent=2)
+
 if __name__ == "__main__":
     # Initialize and run the server
     mcp.run(transport='stdio')
\ No newline at end of file
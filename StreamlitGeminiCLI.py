@@ -2,10 +2,21 @@ import streamlit as st
 import subprocess
 import sys
 
+from gemini_cache import get_cache, is_cacheable, tool_max_age
+from gemini_stream import stream_command
+
 # Define the container ID as a constant, as you provided.
 CONTAINER_ID = "3568825b96edf2f00baa3f57716c604a63f7c161628760cc7b6616cc5c55ea2b"
 
-def run_gemini_in_docker(container_id, user_prompt):
+def container_tools(container_id):
+    """Tool configuration for cache keys: the container's Gemini CLI loads its own MCP servers."""
+    return {"container": container_id}
+
+def cache_key(container_id, user_prompt):
+    """Cache key for a prompt sent to the Gemini CLI in the given container."""
+    return get_cache().make_key(user_prompt, model="gemini-cli", tools=container_tools(container_id))
+
+def run_gemini_in_docker(container_id, user_prompt, bypass_cache=False):
     """
     Executes the Gemini CLI inside a running Docker container with the given prompt.
     This function is a direct copy of your provided logic.
@@ -13,10 +24,18 @@ def run_gemini_in_docker(container_id, user_prompt):
     Args:
         container_id (str): The name or ID of the running Docker container.
         user_prompt (str): The prompt to send to the Gemini CLI.
+        bypass_cache (bool): Skip the response cache lookup.
 
     Returns:
         str: The output from the Gemini CLI, or an error message.
     """
+    # Errors and empty answers are returned but never cached; tool-backed answers go stale quickly
+    return get_cache().get_or_call(
+        cache_key(container_id, user_prompt), lambda: _run_in_docker(container_id, user_prompt),
+        bypass=bypass_cache, should_cache=is_cacheable, max_age=tool_max_age(container_tools(container_id))
+    )
+
+def _run_in_docker(container_id, user_prompt):
     try:
         # Construct the full command to execute inside the container.
         command_in_container = f"gemini '{user_prompt}'"
@@ -48,6 +67,39 @@ def run_gemini_in_docker(container_id, user_prompt):
         # This handles cases where the 'docker' command is not in the system's PATH.
         return "Error: 'docker' command not found. Please ensure Docker is installed and in your PATH."
 
+def stream_gemini_in_docker(container_id, user_prompt, bypass_cache=False):
+    """
+    Streaming variant of run_gemini_in_docker: yields the Gemini CLI output as it is produced.
+
+    Args:
+        container_id (str): The name or ID of the running Docker container.
+        user_prompt (str): The prompt to send to the Gemini CLI.
+        bypass_cache (bool): Skip the response cache lookup.
+
+    Yields:
+        str: Chunks of the CLI output, followed by an error message if the command failed.
+    """
+    command_in_container = f"gemini '{user_prompt}'"
+    docker_command = [
+        'docker',
+        'exec',
+        container_id,
+        '/bin/sh',
+        '-c',
+        command_in_container
+    ]
+
+    try:
+        # A cached response arrives as a single chunk; a fresh one is cached once it completes
+        yield from get_cache().stream(
+            cache_key(container_id, user_prompt), lambda: stream_command(docker_command), bypass=bypass_cache,
+            max_age=tool_max_age(container_tools(container_id))
+        )
+    except subprocess.CalledProcessError as e:
+        yield f"Error executing command in Docker container: {e.stderr}"
+    except FileNotFoundError:
+        yield "Error: 'docker' command not found. Please ensure Docker is installed and in your PATH."
+
 # --- Streamlit UI Setup ---
 
 st.set_page_config(page_title="Dockerized Gemini Chat", layout="centered")
@@ -59,6 +111,10 @@ st.markdown("Interact with the Gemini CLI running inside your Docker container."
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Identical prompts are answered from the shared response cache unless bypassed
+bypass_cache = st.sidebar.checkbox("Bypass response cache")
+st.sidebar.caption("Cache: {hits} hits / {misses} misses".format(**get_cache().stats))
+
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -72,14 +128,10 @@ if prompt := st.chat_input("What is up?"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Display a loading indicator while the response is being generated
-    with st.spinner("Sending prompt to Gemini CLI..."):
-        # Run the command and get the response
-        response = run_gemini_in_docker(CONTAINER_ID, "-p " + prompt)
-    
-    # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response})
-    # Display assistant response in chat message container
+    # Stream the response into the assistant message as the CLI produces it
     with st.chat_message("assistant"):
-        st.markdown(response)
+        response = st.write_stream(stream_gemini_in_docker(CONTAINER_ID, "-p " + prompt, bypass_cache))
+
+    # Add assistant response to chat history
+    st.session_state.messages.append({"role": "assistant", "content": response.strip()})
 
@@ -1,20 +1,38 @@
+import shutil
 import streamlit as st
 import subprocess
 import sys
 
+from gemini_cache import cli_tool_config, get_cache, is_cacheable, tool_max_age
+from gemini_stream import stream_command
+
 # Since Docker is no longer being used, the CONTAINER_ID is not needed.
 # We will run the gemini command directly on the host machine.
 
-def run_gemini_cli(user_prompt):
+def cache_key(user_prompt, tools):
+    """Cache key for a prompt sent to the local Gemini CLI with the given MCP servers."""
+    return get_cache().make_key(user_prompt, model="gemini-cli", tools=tools)
+
+def run_gemini_cli(user_prompt, bypass_cache=False):
     """
     Executes the Gemini CLI directly on the local machine with the given prompt.
 
     Args:
         user_prompt (str): The prompt to send to the Gemini CLI.
+        bypass_cache (bool): Skip the response cache lookup.
 
     Returns:
         str: The output from the Gemini CLI, or an error message.
     """
+    # The CLI's MCP servers can change the answer, and tool-backed answers go stale quickly;
+    # errors and empty answers are returned but never cached
+    tools = cli_tool_config()
+    return get_cache().get_or_call(
+        cache_key(user_prompt, tools), lambda: _run_cli(user_prompt),
+        bypass=bypass_cache, should_cache=is_cacheable, max_age=tool_max_age(tools)
+    )
+
+def _run_cli(user_prompt):
     try:
         # Construct the full command to execute.
         # We use "-p" for non-interactive mode as per the README.md file.
@@ -42,6 +60,34 @@ def run_gemini_cli(user_prompt):
         # This handles cases where the 'gemini' command is not found.
         return e
 
+def stream_gemini_cli(user_prompt, bypass_cache=False):
+    """
+    Streaming variant of run_gemini_cli: yields the Gemini CLI output as it is produced.
+
+    Args:
+        user_prompt (str): The prompt to send to the Gemini CLI.
+        bypass_cache (bool): Skip the response cache lookup.
+
+    Yields:
+        str: Chunks of the CLI output, followed by an error message if the command failed.
+    """
+    # Resolve gemini(.cmd) up front so the process can be run without a shell
+    command = [
+        shutil.which('gemini') or 'gemini',
+        '-p',
+        user_prompt
+    ]
+
+    try:
+        # A cached response arrives as a single chunk; a fresh one is cached once it completes
+        tools = cli_tool_config()
+        yield from get_cache().stream(cache_key(user_prompt, tools), lambda: stream_command(command),
+                                      bypass=bypass_cache, max_age=tool_max_age(tools))
+    except subprocess.CalledProcessError as e:
+        yield f"Error executing Gemini CLI: {e.stderr}"
+    except FileNotFoundError as e:
+        yield str(e)
+
 # --- Streamlit UI Setup ---
 
 st.set_page_config(page_title="Gemini Chat", layout="centered")
@@ -53,6 +99,10 @@ st.markdown("Interact with the Gemini CLI")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Identical prompts are answered from the shared response cache unless bypassed
+bypass_cache = st.sidebar.checkbox("Bypass response cache")
+st.sidebar.caption("Cache: {hits} hits / {misses} misses".format(**get_cache().stats))
+
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -66,13 +116,9 @@ if prompt := st.chat_input("What is up?"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Display a loading indicator while the response is being generated
-    with st.spinner("Sending prompt to Gemini CLI..."):
-        # Run the command and get the response
-        response = run_gemini_cli(prompt)
-    
-    # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response})
-    # Display assistant response in chat message container
+    # Stream the response into the assistant message as the CLI produces it
     with st.chat_message("assistant"):
-        st.markdown(response)
+        response = st.write_stream(stream_gemini_cli(prompt, bypass_cache))
+
+    # Add assistant response to chat history
+    st.session_state.messages.append({"role": "assistant", "content": response.strip()})
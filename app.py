@@ -1,8 +1,12 @@
 import streamlit as st
 import google.generativeai as genai
 import os
+import uuid
 from dotenv import load_dotenv
 
+from gemini_cache import get_cache
+from history_manager import HistoryManager, summary_prompt
+
 load_dotenv() # Loads variables from .env
 
 # Set a title for the Streamlit app
@@ -11,18 +15,62 @@ st.title("Chatbot")
 # Set the API key
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-# Create a Gemini model instance with a known valid model name.
-# The previous model name was causing an "InvalidArgument" error.
-model = genai.GenerativeModel(os.getenv("GEMINI_MODEL"))
+# Model name for the Gemini API. Changing it starts fresh chat sessions.
+MODEL_NAME = os.getenv("GEMINI_MODEL")
+
+# Stream replies chunk by chunk as they are generated. Set GEMINI_STREAM=0 to
+# wait for the complete reply instead.
+STREAM_RESPONSES = os.getenv("GEMINI_STREAM", "1") != "0"
+
+# Token budget for the history sent with each turn, and how many recent turns are
+# always sent verbatim. Older turns are folded into a running summary.
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "8000"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
 
 # Initialize chat history in session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Identical prompts in the same context are answered from the shared response cache unless bypassed
+bypass_cache = st.sidebar.checkbox("Bypass response cache")
+st.sidebar.caption("Cache: {hits} hits / {misses} misses".format(**get_cache().stats))
+
+# Stable id for this browser session, used to key its cached ChatSession
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
+# Create a Gemini model instance once per model name instead of on every rerun
+@st.cache_resource
+def get_model(model_name):
+    return genai.GenerativeModel(model_name)
+
+# Keep one ChatSession per user session across reruns, so each turn only sends the new
+# message instead of rebuilding and re-uploading the whole conversation. An entry expires
+# an hour after it was created, however active the session is, and at most 500 are kept;
+# the next turn then starts a fresh ChatSession whose history is rebuilt from the transcript.
+@st.cache_resource(ttl=3600, max_entries=500)
+def get_chat_session(session_id, model_name):
+    return get_model(model_name).start_chat()
+
+# Extend the running summary with messages that no longer fit in the history budget
+def summarize_history(previous_summary, messages):
+    return get_model(MODEL_NAME).generate_content(summary_prompt(previous_summary, messages)).text
+
+# The summary and fold position live in session state so they are only ever extended
+if "history_manager" not in st.session_state:
+    st.session_state.history_manager = HistoryManager(
+        summarize_history, max_tokens=HISTORY_MAX_TOKENS, keep_turns=HISTORY_KEEP_TURNS
+    )
+
 # Function to get the chat history in the correct format for the Gemini API
 def get_api_history():
     history = []
-    for msg in st.session_state.messages:
+    manager = st.session_state.history_manager
+    # Older turns are represented by the running summary instead of verbatim
+    if manager.summary:
+        history.append({"role": "user", "parts": [{"text": f"Summary of our conversation so far:\n{manager.summary}"}]})
+        history.append({"role": "model", "parts": [{"text": "Understood, I will keep that context in mind."}]})
+    for msg in manager.recent(st.session_state.messages):
         # The Gemini API expects a list of dictionaries, each with a 'role' and 'parts' key.
         # The 'parts' key's value should be a list of dictionaries with a 'text' key.
         if "role" in msg and "content" in msg:
@@ -31,6 +79,31 @@ def get_api_history():
             history.append({"role": api_role, "parts": [{"text": msg["content"]}]})
     return history
 
+# Yield the text of each streamed chunk, skipping chunks that carry no text parts
+def stream_text(response):
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            continue
+        if text:
+            yield text
+
+# Send the prompt and render the reply into the current container, returning the full text
+def send_and_render(chat, prompt):
+    if STREAM_RESPONSES:
+        try:
+            response = chat.send_message(prompt, stream=True)
+        except Exception as e:
+            # Fall back to the blocking call if the streaming request could not be opened
+            st.caption(f"Streaming unavailable, waiting for the full reply ({e})")
+        else:
+            return st.write_stream(stream_text(response))
+
+    response = chat.send_message(prompt)
+    st.markdown(response.text)
+    return response.text
+
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -45,22 +118,42 @@ if prompt := st.chat_input("What is up?"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Convert history to the API's aexpected format
-    api_history = get_api_history()
-    
-    # Create a chat session with the correctly formatted history
-    # The last message is the current user's prompt, so we don't need to add it to the history
-    chat_history_for_api = api_history[:-1]
-    
-    # Start a chat session with the previous messages
-    chat = model.start_chat(history=chat_history_for_api)
+    # Reuse this session's ChatSession; it already holds every earlier turn
+    chat = get_chat_session(st.session_state.session_id, MODEL_NAME)
 
-    # Send the latest message and get the model's response
-    response = chat.send_message(prompt)
+    # Fold older turns into the running summary once the history outgrows its budget
+    try:
+        folded = st.session_state.history_manager.update(st.session_state.messages[:-1])
+    except Exception as e:
+        folded = False
+        st.caption(f"Could not summarize earlier messages, sending them verbatim ({e})")
+
+    # Rebuild its history only when the summary moved or it is out of sync with the
+    # transcript (new or expired cache entry, model change, or a previous turn that
+    # failed part way through). The last message is the current user's prompt, so it
+    # is not part of the history.
+    api_history = get_api_history()[:-1]
+    try:
+        in_sync = not folded and len(chat.history) == len(api_history)
+    except Exception:
+        in_sync = False
+    if not in_sync:
+        chat.history = api_history
+
+    # The answer depends on the prompt, the model and the history it is sent with
+    cache = get_cache()
+    cache_key = cache.make_key(prompt, model=MODEL_NAME, context=api_history)
 
-    # Display assistant response in chat message container
+    # Send the latest message and display the model's response in the chat message container.
+    # A cache hit skips the ChatSession, whose history is then resynced on the next turn.
     with st.chat_message("assistant"):
-        st.markdown(response.text)
-    
+        response_text = cache.get(cache_key, bypass=bypass_cache)
+        if response_text is not None:
+            st.markdown(response_text)
+        else:
+            response_text = send_and_render(chat, prompt)
+            if response_text:
+                cache.set(cache_key, response_text)
+
     # Add assistant response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": response.text})
+    st.session_state.messages.append({"role": "assistant", "content": response_text})
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# One cache file shared by every entry point (SDK app, CLI apps, MCP clients), so an
+# identical prompt only pays for one model call no matter where it came from.
+CACHE_PATH = os.getenv("GEMINI_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".gemini", "response_cache.sqlite"))
+CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", str(24 * 3600)))
+# Answers produced with MCP tools depend on live data, so they are reused for much
+# less time; GEMINI_CACHE_TOOL_TTL=0 never serves them from the cache
+CACHE_TOOL_TTL = float(os.getenv("GEMINI_CACHE_TOOL_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MEMORY_ENTRIES = int(os.getenv("GEMINI_CACHE_MEMORY_ENTRIES", "256"))
+# GEMINI_CACHE=0 turns caching off everywhere; GEMINI_CACHE_BYPASS=1 skips lookups but still stores
+CACHE_ENABLED = os.getenv("GEMINI_CACHE", "1") != "0"
+CACHE_BYPASS = os.getenv("GEMINI_CACHE_BYPASS", "0") == "1"
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so trivially different spellings of a prompt share a key."""
+    return " ".join(prompt.split())
+
+
+class ResponseCache:
+    """
+    Prompt/response cache with an in-memory LRU in front of a SQLite store.
+
+    Entries expire after `ttl` seconds. The SQLite store is trimmed to `max_entries`
+    by least-recent access, and the in-memory LRU holds at most `memory_entries`.
+    The database runs in WAL mode so several processes can share it. A disabled
+    cache never hits and never stores.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 memory_entries=CACHE_MEMORY_ENTRIES, enabled=True):
+        self.enabled = enabled
+        if not enabled:
+            path = ":memory:"
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.stats = {"hits": 0, "memory_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypassed": 0}
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(prompt, model=None, tools=None, context=None):
+        """
+        Builds a cache key from the normalized prompt and everything that can change the answer.
+
+        Args:
+            prompt (str): The user prompt.
+            model (str): Model or backend name.
+            tools: Tool configuration (any JSON-serializable value; dict keys are sorted).
+            context: Conversation context the prompt is sent with, if any.
+
+        Returns:
+            str: A hex digest.
+        """
+        payload = json.dumps(
+            {"prompt": normalize_prompt(prompt), "model": model, "tools": tools, "context": context},
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, bypass=False, max_age=None):
+        """
+        Args:
+            key (str): Key from make_key.
+            bypass (bool): Skip the lookup (counts as bypassed, not as a miss).
+            max_age (float): Oldest entry to accept, in seconds, when shorter than the cache TTL.
+
+        Returns:
+            str or None: The cached response, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        if bypass or CACHE_BYPASS:
+            with self._lock:
+                self.stats["bypassed"] += 1
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created < ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    self.stats["memory_hits"] += 1
+                    return value
+                if now - created >= self.ttl:
+                    del self._memory[key]
+
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            value, created = row
+            if now - created >= self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats["misses"] += 1
+                return None
+            if now - created >= ttl:
+                # Too old for this caller; the caller's fresh answer will replace it
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, value, created)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._remember(key, value, now)
+            self.stats["stores"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def get_or_call(self, key, call, bypass=False, should_cache=bool, max_age=None):
+        """
+        Returns the cached response for `key`, or calls `call()` and caches its result.
+
+        Args:
+            key (str): Key from make_key.
+            call (callable): Produces the response on a miss.
+            bypass (bool): Always call, but still store the fresh result.
+            should_cache (callable): Decides whether a result may be stored (e.g. not errors).
+            max_age (float): As for get.
+        """
+        cached = self.get(key, bypass=bypass, max_age=max_age)
+        if cached is not None:
+            return cached
+        value = call()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    def stream(self, key, stream_factory, bypass=False, max_age=None):
+        """
+        Streaming counterpart of get_or_call: yields the cached response as one chunk,
+        or passes through the chunks of `stream_factory()` and stores the joined text
+        if the stream finished without raising.
+        """
+        cached = self.get(key, bypass=bypass, max_age=max_age)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in stream_factory():
+            chunks.append(chunk)
+            yield chunk
+        value = "".join(chunks).strip()
+        if value:
+            self.set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        expired = self._conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,)).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (overflow,),
+            )
+        self.stats["evictions"] += expired + max(overflow, 0)
+
+
+# Responses starting with these are error messages from one of the entry points
+ERROR_PREFIXES = ("[Gemini Error]", "Error executing", "Error: ", "An error occurred")
+
+
+def is_cacheable(response):
+    """Whether a response may be stored: not empty and not an error message."""
+    return isinstance(response, str) and bool(response.strip()) and not response.startswith(ERROR_PREFIXES)
+
+
+def cli_tool_config(settings_path=None):
+    """
+    MCP servers the Gemini CLI loads from its settings.json, for cache keys.
+
+    Returns:
+        dict: Server name -> server settings; empty when none are configured.
+    """
+    path = settings_path or os.path.join(os.path.expanduser("~"), ".gemini", "settings.json")
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("mcpServers") or {}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def tool_max_age(tools):
+    """Max age for cached answers: CACHE_TOOL_TTL when any tools are configured, else the full TTL."""
+    return CACHE_TOOL_TTL if tools and any(tools.values()) else None
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide shared cache (disabled when GEMINI_CACHE=0).
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(enabled=CACHE_ENABLED)
+        return _shared_cache
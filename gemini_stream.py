@@ -0,0 +1,54 @@
+import codecs
+import subprocess
+import threading
+
+
+def stream_command(command, chunk_size=4096):
+    """
+    Runs a command and yields its stdout incrementally as decoded text chunks.
+
+    Chunks are yielded as soon as the process writes them, so callers can render
+    the first tokens long before the process exits. stderr is drained on a
+    background thread so a chatty process cannot deadlock on a full pipe.
+
+    Args:
+        command (list): The command to run (no shell).
+        chunk_size (int): Maximum number of bytes read per chunk.
+
+    Yields:
+        str: Pieces of stdout text as they become available.
+
+    Raises:
+        subprocess.CalledProcessError: After the output is exhausted, if the
+            process exited with a non-zero status (stderr is attached).
+        FileNotFoundError: If the executable does not exist.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        while True:
+            # read1 returns whatever is available instead of waiting for a full buffer
+            data = process.stdout.read1(chunk_size)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+        process.wait()
+    finally:
+        # The consumer stopped early (e.g. the Streamlit script was rerun): don't leave an orphan
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    stderr_reader.join()
+    if process.returncode != 0:
+        stderr = b"".join(stderr_chunks).decode("utf-8", errors="replace")
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
@@ -0,0 +1,140 @@
+import math
+
+
+def estimate_tokens(text):
+    """
+    Cheap local token estimate (about four characters per token for English text).
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    return math.ceil(len(text) / 4) if text else 0
+
+
+class HistoryManager:
+    """
+    Keeps the conversation sent to the model within a token budget.
+
+    The last `keep_turns` user/assistant turns are kept verbatim. Older messages are
+    folded into a running summary, a batch at a time, by calling
+    `summarize(previous_summary, messages)`. Only newly folded messages are passed
+    to `summarize`, so the summary is extended incrementally instead of being
+    recomputed from the whole transcript.
+
+    Messages use the Streamlit chat format: {"role": ..., "content": ...}.
+    """
+
+    def __init__(self, summarize, max_tokens=8000, keep_turns=6, fold_turns=2, count_tokens=estimate_tokens):
+        """
+        Args:
+            summarize (callable): Takes (previous_summary, messages) and returns the new summary.
+            max_tokens (int): Budget for the summary plus the verbatim messages.
+            keep_turns (int): Number of most recent turns always kept verbatim.
+            fold_turns (int): Minimum number of surplus turns folded at once, so the
+                summarizer is not called on every single turn.
+            count_tokens (callable): Token counter for a piece of text.
+        """
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.fold_turns = fold_turns
+        self.count_tokens = count_tokens
+        self.summary = ""
+        # Number of leading messages already folded into the summary
+        self.summarized_count = 0
+        self._token_cache = {}
+
+    def _message_tokens(self, message):
+        # Messages never change once written, so cache their counts by identity and length
+        key = (id(message), len(message["content"]))
+        if key not in self._token_cache:
+            self._token_cache[key] = self.count_tokens(message["content"])
+        return self._token_cache[key]
+
+    def token_count(self, messages):
+        """
+        Args:
+            messages (list): The full transcript.
+
+        Returns:
+            int: Estimated tokens that would be sent: the summary plus the unfolded messages.
+        """
+        recent = messages[self.summarized_count:]
+        return self.count_tokens(self.summary) + sum(self._message_tokens(m) for m in recent)
+
+    def recent(self, messages):
+        """
+        Args:
+            messages (list): The full transcript.
+
+        Returns:
+            list: The messages that are still sent verbatim.
+        """
+        return messages[self.summarized_count:]
+
+    def update(self, messages):
+        """
+        Folds surplus messages into the summary if the history is over its turn or token budget.
+
+        Args:
+            messages (list): The full transcript that is about to be sent.
+
+        Returns:
+            bool: True if the summary changed (and any cached history must be rebuilt).
+        """
+        if len(messages) < self.summarized_count:
+            # The transcript was reset; start over.
+            self.reset()
+
+        recent = messages[self.summarized_count:]
+        keep = 2 * self.keep_turns
+        surplus = max(len(recent) - keep, 0)
+        over_budget = self.token_count(messages) > self.max_tokens
+
+        if surplus < 2 * self.fold_turns and not over_budget:
+            return False
+
+        fold = surplus
+        if over_budget:
+            # Fold whole turns until the rest fits, always keeping the latest turn verbatim
+            budget = self.max_tokens - self.count_tokens(self.summary)
+            remaining = sum(self._message_tokens(m) for m in recent[fold:])
+            while remaining > budget and fold < len(recent) - 2:
+                remaining -= sum(self._message_tokens(m) for m in recent[fold:fold + 2])
+                fold += 2
+        if fold <= 0:
+            return False
+
+        self.summary = self.summarize(self.summary, recent[:fold])
+        self.summarized_count += fold
+        self._token_cache.clear()
+        return True
+
+    def reset(self):
+        self.summary = ""
+        self.summarized_count = 0
+        self._token_cache.clear()
+
+
+def summary_prompt(previous_summary, messages):
+    """
+    Builds the prompt used to extend a running conversation summary.
+
+    Args:
+        previous_summary (str): The summary so far (may be empty).
+        messages (list): The messages to fold into it.
+
+    Returns:
+        str: A prompt asking the model for the updated summary.
+    """
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    return (
+        "You maintain a concise running summary of a conversation between a user and an assistant.\n"
+        "Update the summary so it also covers the new messages. Keep facts, names, decisions and "
+        "open questions; drop small talk. Reply with the updated summary only.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}"
+    )
@@ -1,6 +1,18 @@
 import subprocess
 
-def run_gemini_in_docker(container_id, user_prompt):
+from gemini_cache import get_cache, is_cacheable, tool_max_age
+
+def run_gemini_in_docker(container_id, user_prompt, bypass_cache=False):
+    # Identical prompts for the same container are served from the shared response cache
+    # Answers from the container's MCP tools are only reused for GEMINI_CACHE_TOOL_TTL seconds,
+    # and errors or empty answers are never stored
+    cache = get_cache()
+    tools = {"container": container_id}
+    key = cache.make_key(user_prompt, model="gemini-cli", tools=tools)
+    return cache.get_or_call(key, lambda: _run_in_docker(container_id, user_prompt), bypass=bypass_cache,
+                             should_cache=is_cacheable, max_age=tool_max_age(tools))
+
+def _run_in_docker(container_id, user_prompt):
     try:
         # Construct the full command to execute inside the container.
         # We're using `sh -c` to allow the prompt to be passed as a single string.